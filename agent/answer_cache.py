@@ -0,0 +1,146 @@
+# answer_cache.py
+"""
+Semantic cache of /ask answers, per video.
+
+Each video has a Redis hash `answers:<video_id>` of entries holding the
+query embedding and the generated answer. A new query whose embedding has
+cosine similarity >= ANSWER_CACHE_THRESHOLD with a cached query gets the
+cached answer without retrieval or a chat completion. Buckets are capped at
+ANSWER_CACHE_MAX_PER_VIDEO entries (least recently hit evicted first),
+entries expire after ANSWER_CACHE_TTL seconds (lookups delete the expired
+ones they come across), and a bucket is dropped when its video is
+re-processed. The bucket's own TTL is set when it is created and not pushed
+back by later stores, so an idle video's bucket never outlives its entries
+by more than ANSWER_CACHE_TTL.
+"""
+import os
+import json
+import time
+import base64
+import logging
+import uuid
+
+import numpy as np
+import redis
+
+from agent.clients import get_redis
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_PER_VIDEO = int(os.getenv("ANSWER_CACHE_MAX_PER_VIDEO", "200"))
+
+STATS_KEY = "answers:stats"
+
+
+def _bucket_key(video_id: str) -> str:
+    return f"answers:{video_id}"
+
+
+def _encode(vector: list) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+def lookup_answer(video_id: str, query_embedding: list):
+    """
+    Returns {"answer", "citations"} cached for the most similar earlier query
+    on this video if it clears the threshold, else None. Redis errors count
+    as misses.
+    """
+    try:
+        entries = get_redis().hgetall(_bucket_key(video_id))
+        now = time.time()
+        best_id, best_entry, best_score = None, None, -1.0
+        expired = []
+        if entries:
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            for entry_id, raw in entries.items():
+                entry = json.loads(raw)
+                if now - entry["created_at"] > ANSWER_CACHE_TTL:
+                    expired.append(entry_id)
+                    continue
+                cached = _decode(entry["embedding"])
+                score = float(cached @ query / (np.linalg.norm(cached) or 1.0))
+                if score > best_score:
+                    best_id, best_entry, best_score = entry_id, entry, score
+
+        pipe = get_redis().pipeline()
+        if expired:
+            pipe.hdel(_bucket_key(video_id), *expired)
+        if best_entry is None or best_score < ANSWER_CACHE_THRESHOLD:
+            pipe.hincrby(STATS_KEY, "misses", 1)
+            pipe.execute()
+            return None
+
+        best_entry["last_hit"] = now
+        pipe.hset(_bucket_key(video_id), best_id, json.dumps(best_entry))
+        pipe.hincrby(STATS_KEY, "hits", 1)
+        pipe.hincrbyfloat(STATS_KEY, "saved_seconds", best_entry.get("latency", 0.0))
+        pipe.execute()
+        return {"answer": best_entry["answer"], "citations": best_entry.get("citations", [])}
+    except redis.RedisError as e:
+        logger.warning(f"Answer cache lookup failed: {str(e)}")
+        return None
+
+
+def store_answer(video_id: str, query_embedding: list, answer: str, latency: float, citations: list = None):
+    """
+    Caches an answer along with how long it took to produce (reported as
+    saved time on later hits). Evicts the least recently hit entries once the
+    video's bucket is over its size limit.
+    """
+    now = time.time()
+    entry = {
+        "embedding": _encode(query_embedding),
+        "answer": answer,
+        "citations": citations or [],
+        "latency": latency,
+        "created_at": now,
+        "last_hit": now,
+    }
+    key = _bucket_key(video_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hset(key, uuid.uuid4().hex, json.dumps(entry))
+        pipe.ttl(key)
+        pipe.hlen(key)
+        _, ttl, size = pipe.execute()
+        if ttl == -1:
+            # A new bucket: expire it, but don't keep pushing that back on every store
+            get_redis().expire(key, ANSWER_CACHE_TTL)
+        if size > ANSWER_CACHE_MAX_PER_VIDEO:
+            entries = get_redis().hgetall(key)
+            by_recency = sorted(entries, key=lambda entry_id: json.loads(entries[entry_id])["last_hit"])
+            evicted = by_recency[:size - ANSWER_CACHE_MAX_PER_VIDEO]
+            if evicted:
+                get_redis().hdel(key, *evicted)
+    except redis.RedisError as e:
+        logger.warning(f"Answer cache write failed: {str(e)}")
+
+
+def invalidate_video(video_id: str):
+    """Drops every cached answer for a video (called when it is re-processed)."""
+    try:
+        get_redis().delete(_bucket_key(video_id))
+    except redis.RedisError as e:
+        logger.warning(f"Answer cache invalidation failed for video_id={video_id}: {str(e)}")
+
+
+def answer_cache_stats() -> dict:
+    """Hit/miss counts, hit rate and total answer latency saved by hits."""
+    stats = get_redis().hgetall(STATS_KEY)
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "saved_seconds": float(stats.get("saved_seconds", 0.0)),
+    }
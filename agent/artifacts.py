@@ -0,0 +1,205 @@
+# artifacts.py
+"""
+Per-video artifact store.
+
+The transcript, summary and Pinecone chunk vectors of a video do not depend
+on who asked for it, so they are stored once in the "videos" collection,
+keyed by the YouTube video ID. A user's blog is a small document linked to
+those shared artifacts, which lets a second user's request for an already
+processed video complete without re-running the crew or re-embedding.
+
+Each text is stored once. The transcript is kept compressed (zstd when the
+`zstandard` package is installed, zlib otherwise) and chunks are kept as
+(start, end) character offsets into it; vector metadata only holds IDs.
+Readers rehydrate chunk texts from these fields, and blogs get their
+transcript and summary from the video when they are returned by the API.
+"""
+import os
+import json
+import zlib
+from datetime import datetime
+
+from agent.bm25 import build_bm25_index
+
+ARTIFACT_COMPRESSION_LEVEL = int(os.getenv("ARTIFACT_COMPRESSION_LEVEL", "9"))
+
+try:
+    import zstandard
+except ImportError:  # optional; transcripts are zlib-compressed without it
+    zstandard = None
+
+# Fields needed to rehydrate chunk texts (new and pre-compression layouts)
+CHUNK_FIELDS = {"transcript_compressed": 1, "chunk_offsets": 1, "chunks": 1, "chunk_times": 1}
+
+
+def summary_vector_id(video_id: str) -> str:
+    return f"{video_id}_summary"
+
+
+def chunk_vector_id(video_id: str, chunk_index: int) -> str:
+    return f"{video_id}_{chunk_index}"
+
+
+def compress_text(text: str) -> dict:
+    """Compresses `text` into a {"codec", "data"} document for Mongo."""
+    data = text.encode("utf-8")
+    if zstandard is not None:
+        return {"codec": "zstd", "data": zstandard.ZstdCompressor(level=ARTIFACT_COMPRESSION_LEVEL).compress(data)}
+    return {"codec": "zlib", "data": zlib.compress(data, ARTIFACT_COMPRESSION_LEVEL)}
+
+
+def decompress_text(blob: dict) -> str:
+    """Inverse of `compress_text`."""
+    if blob["codec"] == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This transcript is zstd-compressed; install the zstandard package to read it")
+        data = zstandard.ZstdDecompressor().decompress(bytes(blob["data"]))
+    elif blob["codec"] == "zlib":
+        data = zlib.decompress(bytes(blob["data"]))
+    else:
+        raise ValueError(f"Unknown transcript codec: {blob['codec']}")
+    return data.decode("utf-8")
+
+
+def chunk_offsets(transcript: str, chunk_texts: list) -> list:
+    """
+    (start, end) offsets of each chunk in `transcript`, or None if a chunk
+    isn't a substring of it. Chunks are in transcript order, so each one is
+    searched for from where the previous one starts (they may overlap).
+    """
+    offsets, cursor = [], 0
+    for text in chunk_texts:
+        start = transcript.find(text, cursor)
+        if start < 0:
+            return None
+        offsets.append([start, start + len(text)])
+        cursor = start
+    return offsets
+
+
+def artifact_transcript(artifacts: dict) -> str:
+    """The video's transcript, from either storage layout."""
+    if "transcript_compressed" in artifacts:
+        return decompress_text(artifacts["transcript_compressed"])
+    return artifacts.get("transcript")
+
+
+def artifact_chunk_texts(artifacts: dict) -> list:
+    """
+    All chunk texts of the video in chunk_index order. `artifacts` needs at
+    least the CHUNK_FIELDS.
+    """
+    if "chunk_offsets" in artifacts:
+        transcript = artifact_transcript(artifacts)
+        return [transcript[start:end] for start, end in artifacts["chunk_offsets"]]
+    return artifacts.get("chunks") or []
+
+
+def find_video_artifacts(videos_collection, video_id: str) -> dict:
+    """Returns the stored artifacts for `video_id`, or None if it hasn't been processed."""
+    if not video_id:
+        return None
+    return videos_collection.find_one({"_id": video_id})
+
+
+def save_video_artifacts(videos_collection, video_id: str, youtube_url: str, video_title: str,
+                         thumbnail_url: str, transcript: str, comprehensive_summary: str,
+                         chunks: list, duration: int = None) -> dict:
+    """
+    Stores (or replaces) the shared artifacts for a video and returns the document.
+    `chunks` are {"text", "start", "end"} dicts (timestamps may be None).
+    Chunk vectors live in the vector store under `chunk_vector_id(video_id, i)`
+    for each index i into `chunks`; the chunk offsets, their timestamps and
+    their BM25 index are kept here for retrieval and citations. Chunks that
+    can't be located in the transcript are stored as plain texts instead.
+    `duration` is the video length in seconds, if known.
+    """
+    chunk_texts = [chunk["text"] for chunk in chunks]
+    # Chunk texts are whitespace-normalized, so normalize the transcript the same way
+    transcript = " ".join((transcript or "").split())
+    artifacts = {
+        "_id": video_id,
+        "video_id": video_id,
+        "youtube_url": youtube_url,
+        "video_title": video_title,
+        "thumbnail": thumbnail_url,
+        "duration": duration,
+        "transcript_compressed": compress_text(transcript),
+        "comprehensive_summary": comprehensive_summary,
+        "chunk_count": len(chunks),
+        "chunk_times": [[chunk["start"], chunk["end"]] for chunk in chunks],
+        "bm25_index": build_bm25_index(chunk_texts),
+        "created_at": datetime.now(),
+    }
+    offsets = chunk_offsets(transcript, chunk_texts)
+    if offsets is not None:
+        artifacts["chunk_offsets"] = offsets
+    else:
+        artifacts["chunks"] = chunk_texts
+    videos_collection.replace_one({"_id": video_id}, artifacts, upsert=True)
+    return artifacts
+
+
+def blog_from_artifacts(user_id: str, youtube_url: str, artifacts: dict) -> dict:
+    """
+    Builds the user's blog document for a processed video. The transcript
+    and summary stay in the artifacts; `ahydrate_blogs` adds them back when
+    the blog is returned.
+    """
+    return {
+        "user_id": user_id,
+        "video_id": artifacts["video_id"],
+        "video_title": artifacts["video_title"],
+        "youtube_url": youtube_url,
+        "thumbnail": artifacts["thumbnail"],
+        "duration": artifacts.get("duration"),
+        "created_at": datetime.now(),
+    }
+
+
+def link_blog_to_artifacts(blogs_collection, user_id: str, youtube_url: str, artifacts: dict) -> str:
+    """
+    Creates the user's blog for an already processed video and returns its _id
+    as a string.
+    """
+    inserted = blogs_collection.insert_one(blog_from_artifacts(user_id, youtube_url, artifacts))
+    return str(inserted.inserted_id)
+
+
+async def afind_video_artifacts(videos_collection, video_id: str) -> dict:
+    """Async (AsyncMongoClient) version of `find_video_artifacts`."""
+    if not video_id:
+        return None
+    return await videos_collection.find_one({"_id": video_id})
+
+
+async def alink_blog_to_artifacts(blogs_collection, user_id: str, youtube_url: str, artifacts: dict) -> str:
+    """Async (AsyncMongoClient) version of `link_blog_to_artifacts`."""
+    inserted = await blogs_collection.insert_one(blog_from_artifacts(user_id, youtube_url, artifacts))
+    return str(inserted.inserted_id)
+
+
+async def ahydrate_blogs(videos_collection, blogs: list) -> list:
+    """
+    Adds the transcript and summary of their videos to blogs that are linked
+    to shared artifacts, in the JSON-encoded form the API has always
+    returned. The videos are fetched in one query. Blogs that still carry
+    their own copies (created before the artifacts were shared) are left as
+    they are.
+    """
+    video_ids = list({blog["video_id"] for blog in blogs if blog.get("video_id") and "transcript" not in blog})
+    if not video_ids:
+        return blogs
+    videos = {
+        artifacts["_id"]: artifacts
+        async for artifacts in videos_collection.find(
+            {"_id": {"$in": video_ids}},
+            {"transcript_compressed": 1, "transcript": 1, "comprehensive_summary": 1},
+        )
+    }
+    for blog in blogs:
+        artifacts = videos.get(blog.get("video_id"))
+        if artifacts and "transcript" not in blog:
+            blog["transcript"] = json.dumps(artifact_transcript(artifacts))
+            blog["comprehensive_summary"] = json.dumps(artifacts.get("comprehensive_summary"))
+    return blogs
@@ -0,0 +1,158 @@
+# batch.py
+"""
+Redis-backed state of bulk ingestion batches.
+
+A batch is a user's list of videos to process. Videos that can be served
+right away (the user already has a blog, or another user's request already
+produced the artifacts) are recorded as completed when the batch is
+created; the rest go on the batch's pending queue. At most
+`max_concurrency` of a batch's videos are processing at once: the scheduler
+(`agent.tasks.schedule_batch`) takes the next video only while a slot is
+free, and every finished video frees its slot and schedules the next one.
+
+Keys (all expire after BATCH_TTL seconds):
+  batch:<id>          hash of user_id, total, max_concurrency, created_at
+  batch:<id>:pending  list of video IDs still to schedule
+  batch:<id>:running  number of videos currently holding a slot
+  batch:<id>:items    hash of video_id -> JSON {"youtube_url", "status", ...}
+
+Item statuses: queued, processing, coalesced (attached to another request's
+in-flight task), completed, failed.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+
+from agent.clients import get_redis, RedisScript
+
+logger = logging.getLogger(__name__)
+
+BATCH_TTL = int(os.getenv("BATCH_TTL", str(7 * 24 * 3600)))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_VIDEOS = int(os.getenv("BATCH_MAX_VIDEOS", "500"))
+# Celery queue for batch work, consumed by its own workers so bulk ingestion
+# never takes worker slots from interactive /process-video requests
+BULK_QUEUE = os.getenv("BULK_QUEUE", "bulk")
+
+# Pop the next pending video if the batch has a free slot, and take the slot
+TAKE_SCRIPT = RedisScript("""
+local running = tonumber(redis.call('GET', KEYS[2]) or '0')
+if running >= tonumber(ARGV[1]) then
+    return false
+end
+local video_id = redis.call('LPOP', KEYS[1])
+if not video_id then
+    return false
+end
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return video_id
+""")
+
+# Record a processing item's outcome and free its slot; a no-op for items
+# that already finished, so duplicate callbacks can't free a slot twice
+FINISH_SCRIPT = RedisScript("""
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then
+    return 0
+end
+local item = cjson.decode(raw)
+if item['status'] ~= 'processing' then
+    return 0
+end
+local update = cjson.decode(ARGV[2])
+for key, value in pairs(update) do
+    item[key] = value
+end
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(item))
+redis.call('DECR', KEYS[2])
+return 1
+""")
+
+
+def _meta_key(batch_id: str) -> str:
+    return f"batch:{batch_id}"
+
+
+def _pending_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:pending"
+
+
+def _running_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:running"
+
+
+def _items_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:items"
+
+
+def create_batch(user_id: str, items: dict, max_concurrency: int = BATCH_MAX_CONCURRENCY) -> str:
+    """
+    Registers a batch. `items` maps video_id -> item dict; items with status
+    "queued" are put on the pending queue in order. Returns the batch ID.
+    """
+    batch_id = uuid.uuid4().hex
+    queued = [video_id for video_id, item in items.items() if item["status"] == "queued"]
+
+    pipe = get_redis().pipeline()
+    pipe.hset(_meta_key(batch_id), mapping={
+        "user_id": user_id,
+        "total": len(items),
+        "max_concurrency": max_concurrency,
+        "created_at": time.time(),
+    })
+    pipe.hset(_items_key(batch_id), mapping={video_id: json.dumps(item) for video_id, item in items.items()})
+    if queued:
+        pipe.rpush(_pending_key(batch_id), *queued)
+    pipe.set(_running_key(batch_id), 0)
+    for key in (_meta_key(batch_id), _items_key(batch_id), _pending_key(batch_id), _running_key(batch_id)):
+        pipe.expire(key, BATCH_TTL)
+    pipe.execute()
+    return batch_id
+
+
+def get_batch(batch_id: str):
+    """Returns (meta, items) for a batch, or (None, {}) if it doesn't exist or expired."""
+    pipe = get_redis().pipeline()
+    pipe.hgetall(_meta_key(batch_id))
+    pipe.hgetall(_items_key(batch_id))
+    meta, raw_items = pipe.execute()
+    if not meta:
+        return None, {}
+    return meta, {video_id: json.loads(raw) for video_id, raw in raw_items.items()}
+
+
+def take_next_item(batch_id: str, max_concurrency: int):
+    """
+    Takes a concurrency slot and returns (video_id, item) for the next
+    pending video, or None if the batch is at its cap or has nothing queued.
+    """
+    video_id = TAKE_SCRIPT(keys=[_pending_key(batch_id), _running_key(batch_id)],
+                           args=[max_concurrency, BATCH_TTL])
+    if not video_id:
+        return None
+    return video_id, json.loads(get_redis().hget(_items_key(batch_id), video_id))
+
+
+def update_item(batch_id: str, video_id: str, **fields):
+    """Merges `fields` into an item without touching the slot count."""
+    key = _items_key(batch_id)
+    item = json.loads(get_redis().hget(key, video_id))
+    item.update(fields)
+    get_redis().hset(key, video_id, json.dumps(item))
+
+
+def release_slot(batch_id: str):
+    """Frees a slot taken by `take_next_item` that didn't start a task."""
+    get_redis().decr(_running_key(batch_id))
+
+
+def finish_item(batch_id: str, video_id: str, status: str, **fields) -> bool:
+    """
+    Records the outcome of a processing item and frees its slot. Returns
+    False if the item had already finished.
+    """
+    update = json.dumps({"status": status, **fields})
+    return bool(FINISH_SCRIPT(keys=[_items_key(batch_id), _running_key(batch_id)], args=[video_id, update]))
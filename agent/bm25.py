@@ -0,0 +1,72 @@
+# bm25.py
+"""
+BM25 keyword index over a video's transcript chunks, plus reciprocal rank
+fusion for combining it with vector search.
+
+Embeddings are weak at exact terms (names, numbers, code identifiers), so
+`/ask` fuses both rankings. The index is built once at ingest time and
+stored with the video's artifacts as a plain dict.
+"""
+import re
+import math
+from collections import Counter
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def build_bm25_index(chunks: list) -> dict:
+    """
+    Builds an inverted index: {"postings": {term: [[chunk_index, tf], ...]},
+    "doc_lengths": [...], "avgdl": float}. Chunk indices match the order of
+    `chunks`.
+    """
+    postings = {}
+    doc_lengths = []
+    for idx, chunk in enumerate(chunks):
+        tokens = tokenize(chunk)
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append([idx, tf])
+    avgdl = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+    return {"postings": postings, "doc_lengths": doc_lengths, "avgdl": avgdl}
+
+
+def bm25_search(index: dict, query: str, top_k: int) -> list:
+    """Returns up to `top_k` (chunk_index, score) pairs, best first."""
+    doc_lengths = index["doc_lengths"]
+    n = len(doc_lengths)
+    if not n:
+        return []
+    avgdl = index["avgdl"] or 1.0
+
+    scores = {}
+    for term in set(tokenize(query)):
+        term_postings = index["postings"].get(term)
+        if not term_postings:
+            continue
+        idf = math.log(1 + (n - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+        for idx, tf in term_postings:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[idx] / avgdl)
+            scores[idx] = scores.get(idx, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """
+    Fuses several best-first lists of ids into one: each id scores
+    sum(1 / (k + rank)) over the lists it appears in.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,139 @@
+# chunking.py
+"""
+Sentence-aware, timestamp-preserving transcript chunker.
+
+Works on the raw transcript segments ({"text", "start", "duration"}) so that
+every chunk knows where it starts and ends in the video. Segments are first
+regrouped into sentences, then sentences are packed into chunks under a
+token budget, with a few trailing sentences repeated at the start of the
+next chunk as overlap.
+"""
+import os
+import re
+import bisect
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "60"))
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken missing or its encoding can't be loaded offline
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the embedding model's tokenizer, or an estimate without tiktoken."""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def segments_to_sentences(segments: list) -> list:
+    """
+    Regroups caption segments into sentences of {"text", "start", "end"}.
+    A sentence spans from the start of the segment it begins in to the end
+    of the segment it finishes in. Captions without punctuation fall back to
+    one "sentence" per segment.
+    """
+    has_punctuation = any(SENTENCE_END.search(s["text"] + " ") for s in segments)
+
+    sentences = []
+    current, current_start, current_end = [], None, None
+    for segment in segments:
+        text = " ".join(segment["text"].split())
+        if not text:
+            continue
+        start = float(segment["start"])
+        end = start + float(segment.get("duration", 0.0))
+
+        pieces = SENTENCE_END.split(text) if has_punctuation else [text]
+        for i, piece in enumerate(pieces):
+            if current_start is None:
+                current_start = start
+            current.append(piece)
+            current_end = end
+            # Every piece but the last one ends a sentence inside this segment
+            is_last_piece = i == len(pieces) - 1
+            if not has_punctuation or not is_last_piece or piece.endswith((".", "!", "?")):
+                sentences.append({"text": " ".join(current), "start": current_start, "end": current_end})
+                current, current_start = [], None
+
+    if current:
+        sentences.append({"text": " ".join(current), "start": current_start, "end": current_end})
+    return sentences
+
+
+def _split_long_sentence(sentence: dict, max_tokens: int) -> list:
+    """
+    Splits a sentence over the budget into windows of at most `max_tokens`
+    tokens sharing its timestamps. The sentence is tokenized once and each
+    window is cut back to the last space before its token boundary, so every
+    part stays a substring of the sentence (see `artifacts.chunk_offsets`).
+    """
+    text = sentence["text"]
+    if _encoding is not None:
+        _, starts = _encoding.decode_with_offsets(_encoding.encode(text))
+        window = max_tokens
+    else:
+        # Character windows matching count_tokens' len // 4 + 1 estimate
+        starts = range(len(text))
+        window = max(1, (max_tokens - 1) * 4)
+
+    parts, i = [], 0
+    while len(starts) - i > window:
+        cut = text.rfind(" ", starts[i] + 1, starts[i + window] + 1)
+        if cut == -1:
+            cut = starts[i + window]  # a single word longer than the window
+        parts.append({**sentence, "text": text[starts[i]:cut].strip()})
+        i = bisect.bisect_left(starts, cut)
+    parts.append({**sentence, "text": text[starts[i]:].strip()})
+    return [part for part in parts if part["text"]]
+
+
+def chunk_segments(segments: list, max_tokens: int = CHUNK_MAX_TOKENS,
+                   overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list:
+    """
+    Packs transcript segments into sentence-aligned chunks of at most
+    `max_tokens` tokens, each starting with up to `overlap_tokens` tokens of
+    the previous chunk's trailing sentences. Returns [{"text", "start", "end"}].
+    """
+    sentences = []
+    for sentence in segments_to_sentences(segments):
+        sentence["tokens"] = count_tokens(sentence["text"])
+        if sentence["tokens"] > max_tokens:
+            for part in _split_long_sentence(sentence, max_tokens):
+                part["tokens"] = count_tokens(part["text"])
+                sentences.append(part)
+        else:
+            sentences.append(sentence)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for sentence in sentences:
+        if current and current_tokens + sentence["tokens"] > max_tokens:
+            chunks.append(current)
+            # Carry trailing sentences over as overlap, without re-filling the budget
+            overlap, overlap_size = [], 0
+            for previous in reversed(current):
+                if overlap_size + previous["tokens"] > overlap_tokens or \
+                        overlap_size + previous["tokens"] + sentence["tokens"] > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous["tokens"]
+            current, current_tokens = overlap, overlap_size
+        current.append(sentence)
+        current_tokens += sentence["tokens"]
+    if current:
+        chunks.append(current)
+
+    return [
+        {
+            "text": " ".join(s["text"] for s in chunk),
+            "start": chunk[0]["start"],
+            "end": chunk[-1]["end"],
+        }
+        for chunk in chunks
+    ]
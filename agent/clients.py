@@ -0,0 +1,277 @@
+# clients.py
+"""
+Per-process registry of the external service clients (Mongo, OpenAI,
+Pinecone, Redis).
+
+Every client is created on first use and then shared by the whole process,
+so each process holds one connection pool per service instead of one per
+call. The registry remembers the PID that created its clients: after a
+fork (Celery's prefork pool) the child never reuses the parent's sockets,
+it discards the inherited clients and builds its own. `agent.tasks` also
+resets the registry from `worker_process_init` and closes it from
+`worker_process_shutdown`; the API closes its clients in the lifespan
+shutdown via `aclose_clients`.
+
+Pool sizes and timeouts are read from the environment:
+  MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+  MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+  OPENAI_TIMEOUT, OPENAI_MAX_RETRIES, OPENAI_MAX_CONNECTIONS,
+  OPENAI_MAX_KEEPALIVE_CONNECTIONS, PINECONE_POOL_THREADS,
+  REDIS_URL, REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT
+
+Every Redis user (in-flight claims, batches, stage data, progress, the
+caches, rate limits and metrics) shares the REDIS_URL clients, so a hung
+Redis fails their calls after the same timeouts instead of blocking API
+threads and workers. Lua scripts are declared as `RedisScript`s, which run
+on whichever client the registry currently holds.
+"""
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = os.getenv("DB_NAME", "yt-crew")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+# The SDK's own retries are off by default: a 429 pauses the model in the rate
+# limiter, and worker calls are already retried by `_call_with_retries` and
+# the stages' Celery autoretry, so SDK retries would multiply the requests
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "youtube-summaries")
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "4"))
+
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+
+# Reentrant: the Pinecone index factory fetches the Pinecone client
+_lock = threading.RLock()
+_clients = {}
+_owner_pid = os.getpid()
+
+
+def _mongo_options() -> dict:
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+
+
+def _new_mongo_client():
+    from pymongo import MongoClient
+    return MongoClient(MONGO_URI, **_mongo_options())
+
+
+def _new_async_mongo_client():
+    from pymongo import AsyncMongoClient
+    return AsyncMongoClient(MONGO_URI, **_mongo_options())
+
+
+def _openai_client_options(http_client_class) -> dict:
+    import httpx
+    limits = httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                          max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS)
+    return {
+        "api_key": os.getenv("OPENAI_API_KEY"),
+        "max_retries": OPENAI_MAX_RETRIES,
+        "timeout": OPENAI_TIMEOUT,
+        "http_client": http_client_class(limits=limits, timeout=OPENAI_TIMEOUT),
+    }
+
+
+def _new_openai_client():
+    import httpx
+    import openai
+    return openai.OpenAI(**_openai_client_options(httpx.Client))
+
+
+def _new_async_openai_client():
+    import httpx
+    import openai
+    return openai.AsyncOpenAI(**_openai_client_options(httpx.AsyncClient))
+
+
+def _new_pinecone_client():
+    import pinecone
+    return pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=PINECONE_POOL_THREADS)
+
+
+def _new_pinecone_index():
+    return get_pinecone_client().Index(PINECONE_INDEX_NAME)
+
+
+def _redis_options(decode_responses: bool) -> dict:
+    return {
+        "decode_responses": decode_responses,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+    }
+
+
+def _new_redis_client(decode_responses: bool = True):
+    import redis
+    return redis.Redis.from_url(REDIS_URL, **_redis_options(decode_responses))
+
+
+def _new_async_redis_client(decode_responses: bool = True):
+    import redis.asyncio
+    return redis.asyncio.Redis.from_url(REDIS_URL, **_redis_options(decode_responses))
+
+
+FACTORIES = {
+    "mongo": _new_mongo_client,
+    "async_mongo": _new_async_mongo_client,
+    "openai": _new_openai_client,
+    "async_openai": _new_async_openai_client,
+    "pinecone": _new_pinecone_client,
+    "pinecone_index": _new_pinecone_index,
+    "redis": _new_redis_client,
+    "redis_bytes": lambda: _new_redis_client(decode_responses=False),
+    "async_redis": _new_async_redis_client,
+    "async_redis_bytes": lambda: _new_async_redis_client(decode_responses=False),
+}
+
+
+def _check_pid():
+    # Called with the lock held. Sockets inherited across a fork belong to the
+    # parent, so they are dropped without closing them.
+    global _owner_pid
+    if os.getpid() != _owner_pid:
+        _clients.clear()
+        _owner_pid = os.getpid()
+
+
+def _get(name: str):
+    client = _clients.get(name)
+    if client is not None and os.getpid() == _owner_pid:
+        return client
+    with _lock:
+        _check_pid()
+        if name not in _clients:
+            _clients[name] = FACTORIES[name]()
+        return _clients[name]
+
+
+def get_mongo_client():
+    """The process' pooled synchronous MongoClient."""
+    return _get("mongo")
+
+
+def get_db():
+    """The app database on the shared synchronous client."""
+    return get_mongo_client()[DB_NAME]
+
+
+def get_async_mongo_client():
+    """The process' pooled AsyncMongoClient (API only)."""
+    return _get("async_mongo")
+
+
+def get_async_db():
+    """The app database on the shared async client."""
+    return get_async_mongo_client()[DB_NAME]
+
+
+def get_openai_client():
+    return _get("openai")
+
+
+def get_async_openai_client():
+    return _get("async_openai")
+
+
+def get_pinecone_client():
+    return _get("pinecone")
+
+
+def get_pinecone_index():
+    """Handle on the Pinecone index named PINECONE_INDEX_NAME."""
+    return _get("pinecone_index")
+
+
+def get_redis(decode_responses: bool = True):
+    """
+    The process' shared Redis client. Replies are decoded to str unless
+    `decode_responses` is False (for binary values).
+    """
+    return _get("redis" if decode_responses else "redis_bytes")
+
+
+def get_async_redis(decode_responses: bool = True):
+    """Async (redis.asyncio) version of `get_redis`, for the API's event loop."""
+    return _get("async_redis" if decode_responses else "async_redis_bytes")
+
+
+class RedisScript:
+    """
+    A Lua script run on the shared Redis client, called like redis-py's
+    Script: `SCRIPT(keys=[...], args=[...])`. Unlike a script registered on
+    a client at import, it never holds on to a client the registry has
+    dropped (after a fork or on shutdown). With `asynchronous` it runs on
+    the async client and the call returns an awaitable.
+    """
+
+    def __init__(self, script: str, asynchronous: bool = False):
+        self.script = script
+        self.asynchronous = asynchronous
+
+    def __call__(self, keys: list = None, args: list = None):
+        client = get_async_redis() if self.asynchronous else get_redis()
+        return client.register_script(self.script)(keys=keys or [], args=args or [])
+
+
+def reset_clients():
+    """
+    Forgets every client without closing it. Used in freshly forked worker
+    processes, whose inherited clients share sockets with the parent.
+    """
+    global _owner_pid
+    with _lock:
+        _clients.clear()
+        _owner_pid = os.getpid()
+
+
+def _pop_clients(include_async: bool) -> dict:
+    with _lock:
+        _check_pid()
+        names = [name for name in _clients if include_async or not name.startswith("async_")]
+        return {name: _clients.pop(name) for name in names}
+
+
+def close_clients():
+    """
+    Closes this process' synchronous clients (worker shutdown). Async
+    clients can only be closed from their event loop; see `aclose_clients`.
+    """
+    for name, client in _pop_clients(include_async=False).items():
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close {name} client: {str(e)}")
+
+
+async def aclose_clients():
+    """Closes all of this process' clients, async ones included (API shutdown)."""
+    for name, client in _pop_clients(include_async=True).items():
+        try:
+            if name.startswith("async_redis"):
+                await client.aclose()
+            elif name.startswith("async_"):
+                await client.close()
+            else:
+                client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close {name} client: {str(e)}")
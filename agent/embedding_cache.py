@@ -0,0 +1,202 @@
+# embedding_cache.py
+"""
+Content-addressed cache for embedding vectors.
+
+Entries are keyed on (model, sha256 of the normalized text). Lookups go
+through a small in-process LRU first and then a shared Redis tier, so
+identical text is only embedded once across workers, users and re-runs.
+Hit/miss counters are kept in Redis too, so `embedding_cache_stats()`
+reports the hit rate across every process.
+"""
+import os
+import re
+import array
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from agent.clients import get_redis
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_LOCAL_MAX_ENTRIES", "2048"))
+EMBEDDING_CACHE_REDIS_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_REDIS_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+
+# Sorted set of cache keys scored by last access time, used for LRU trimming in Redis
+REDIS_LRU_KEY = "emb:lru"
+# Hash of hit/miss counters shared by all processes
+STATS_KEY = "emb:stats"
+COUNTERS = ("local_hits", "redis_hits", "misses", "redis_errors")
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so formatting-only differences share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"emb:{model}:{digest}"
+
+
+def _pack(vector: list) -> bytes:
+    return array.array("f", vector).tobytes()
+
+
+def _unpack(data: bytes) -> list:
+    values = array.array("f")
+    values.frombytes(data)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    Two-tier (in-process LRU + Redis) embedding cache with hit/miss counters.
+    Redis errors are logged and treated as misses so the cache never takes
+    embedding generation down with it.
+    """
+
+    def __init__(self, use_redis: bool = True,
+                 local_max_entries: int = EMBEDDING_CACHE_LOCAL_MAX_ENTRIES,
+                 redis_max_entries: int = EMBEDDING_CACHE_REDIS_MAX_ENTRIES):
+        self.use_redis = use_redis
+        self.local_max_entries = local_max_entries
+        self.redis_max_entries = redis_max_entries
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def redis(self):
+        """The shared Redis client (vectors are binary, so undecoded), or None for a local-only cache."""
+        return get_redis(decode_responses=False) if self.use_redis else None
+
+    def _local_get(self, key: str):
+        with self._lock:
+            vector = self._local.get(key)
+            if vector is not None:
+                self._local.move_to_end(key)
+            return vector
+
+    def _local_set(self, key: str, vector: tuple):
+        with self._lock:
+            self._local[key] = vector
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def _count(self, counts: dict):
+        """Adds `counts` to the shared counters in one round trip."""
+        counts = {name: amount for name, amount in counts.items() if amount}
+        if not counts or self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            for name, amount in counts.items():
+                pipe.hincrby(STATS_KEY, name, amount)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to record embedding cache stats: {str(e)}")
+
+    def get_many(self, model: str, texts: list) -> dict:
+        """
+        Returns {text: vector} for every text found in either tier.
+        Redis hits are promoted into the local LRU. The LRU holds tuples and
+        every returned vector is a fresh list, so callers may mutate them.
+        """
+        found = {}
+        remote_keys = {}
+        counts = dict.fromkeys(COUNTERS, 0)
+        for text in texts:
+            key = cache_key(model, text)
+            vector = self._local_get(key)
+            if vector is not None:
+                found[text] = list(vector)
+                counts["local_hits"] += 1
+            else:
+                remote_keys.setdefault(key, []).append(text)
+
+        if remote_keys and self.redis is not None:
+            keys = list(remote_keys)
+            try:
+                values = self.redis.mget(keys)
+                hit_keys = [key for key, value in zip(keys, values) if value is not None]
+                if hit_keys:
+                    now = time.time()
+                    self.redis.zadd(REDIS_LRU_KEY, {key: now for key in hit_keys})
+                for key, value in zip(keys, values):
+                    if value is None:
+                        continue
+                    vector = tuple(_unpack(value))
+                    self._local_set(key, vector)
+                    for text in remote_keys.pop(key):
+                        found[text] = list(vector)
+                        counts["redis_hits"] += 1
+            except redis.RedisError as e:
+                counts["redis_errors"] += 1
+                logger.warning(f"Embedding cache Redis lookup failed: {str(e)}")
+
+        counts["misses"] = sum(len(pending) for pending in remote_keys.values())
+        self._count(counts)
+        return found
+
+    def set_many(self, model: str, items: dict):
+        """Stores {text: vector} in both tiers and trims Redis to its size limit."""
+        if not items:
+            return
+        payload = {}
+        for text, vector in items.items():
+            key = cache_key(model, text)
+            self._local_set(key, tuple(vector))
+            payload[key] = _pack(vector)
+
+        if self.redis is None:
+            return
+        try:
+            now = time.time()
+            pipe = self.redis.pipeline()
+            pipe.mset(payload)
+            pipe.zadd(REDIS_LRU_KEY, {key: now for key in payload})
+            pipe.zcard(REDIS_LRU_KEY)
+            size = pipe.execute()[-1]
+            overflow = size - self.redis_max_entries
+            if overflow > 0:
+                evicted = [key for key, _ in self.redis.zpopmin(REDIS_LRU_KEY, overflow)]
+                if evicted:
+                    self.redis.delete(*evicted)
+        except redis.RedisError as e:
+            self._count({"redis_errors": 1})
+            logger.warning(f"Embedding cache Redis write failed: {str(e)}")
+
+    def stats(self) -> dict:
+        """
+        The shared counters and hit rate, plus this process' local LRU size.
+        Without Redis only the local size is known, reported with
+        "redis": "unavailable".
+        """
+        with self._lock:
+            local_entries = len(self._local)
+        try:
+            raw = self.redis.hgetall(STATS_KEY) if self.redis is not None else {}
+        except redis.RedisError as e:
+            logger.warning(f"Failed to read embedding cache stats: {str(e)}")
+            return {"redis": "unavailable", "local_entries": local_entries}
+        stats = {name: int(raw.get(name.encode(), 0)) for name in COUNTERS}
+        stats["local_entries"] = local_entries
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["local_hits"] + stats["redis_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+embedding_cache = EmbeddingCache() if EMBEDDING_CACHE_ENABLED else None
+
+
+def embedding_cache_stats() -> dict:
+    """Hit/miss counts and hit rate of the embedding cache across all processes."""
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
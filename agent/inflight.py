@@ -0,0 +1,156 @@
+# inflight.py
+"""
+Redis-backed registry of videos that are currently being processed.
+
+The first request for a video claims `inflight:<video_id>` with its Celery
+task ID; concurrent requests for the same video attach to that task as
+waiters instead of enqueuing another one. When the task finishes it
+releases the claim and links a blog for every waiter. Claims expire after
+INFLIGHT_LOCK_TTL seconds so a crashed worker can't block a video forever;
+the pipeline's stages keep refreshing the claim while they run
+(`refresh_claim`, `hold_claim`), so a long video doesn't lose it mid-run.
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager
+
+import redis
+
+from agent.clients import get_redis, RedisScript
+
+logger = logging.getLogger(__name__)
+
+INFLIGHT_LOCK_TTL = int(os.getenv("INFLIGHT_LOCK_TTL", "1800"))
+
+# Delete the claim and hand back the waiters, but only if `task_id` still owns it
+RELEASE_SCRIPT = RedisScript("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+local waiters = redis.call('HGETALL', KEYS[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+return waiters
+""")
+
+# Push back the claim's (and its waiters') expiry, but only if `task_id` still owns it
+REFRESH_SCRIPT = RedisScript("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+return 1
+""")
+
+# Hand the claim from a finished task (ARGV[1]) to a new one (ARGV[2]); its waiters stay attached
+TAKEOVER_SCRIPT = RedisScript("""
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+""")
+
+
+def _lock_key(video_id: str) -> str:
+    return f"inflight:{video_id}"
+
+
+def _waiters_key(video_id: str) -> str:
+    return f"inflight:{video_id}:waiters"
+
+
+def claim_video(video_id: str, task_id: str) -> str:
+    """
+    Tries to register `task_id` as the task processing `video_id`.
+    Returns None if the claim succeeded, otherwise the task ID that already
+    holds it.
+    """
+    if get_redis().set(_lock_key(video_id), task_id, nx=True, ex=INFLIGHT_LOCK_TTL):
+        return None
+    owner = get_redis().get(_lock_key(video_id))
+    if owner is None:
+        # The claim expired or was released between SET and GET; try once more
+        if get_redis().set(_lock_key(video_id), task_id, nx=True, ex=INFLIGHT_LOCK_TTL):
+            return None
+        owner = get_redis().get(_lock_key(video_id))
+    return owner
+
+
+def claim_or_take_over(video_id: str, task_id: str, owner_finished) -> str:
+    """
+    `claim_video`, except that a claim still held by a task that has already
+    finished (its worker died before releasing it) is taken over instead of
+    being waited on until it expires. `owner_finished(owner_task_id)` tells
+    whether a task has finished. Returns None if `task_id` now holds the
+    claim, otherwise the live owner's task ID.
+    """
+    owner = claim_video(video_id, task_id)
+    if owner and owner_finished(owner):
+        if TAKEOVER_SCRIPT(keys=[_lock_key(video_id)], args=[owner, task_id, INFLIGHT_LOCK_TTL]):
+            logger.warning(f"Took over the stale in-flight claim of task {owner} for video_id={video_id}")
+            return None
+        # Someone else released or took over the claim meanwhile
+        owner = claim_video(video_id, task_id)
+    return owner
+
+
+def current_owner(video_id: str) -> str:
+    """Returns the task ID currently processing `video_id`, if any."""
+    return get_redis().get(_lock_key(video_id))
+
+
+def add_waiter(video_id: str, user_id: str, youtube_url: str):
+    """Attaches a user to the in-flight task for `video_id`."""
+    pipe = get_redis().pipeline()
+    pipe.hset(_waiters_key(video_id), user_id, youtube_url)
+    pipe.expire(_waiters_key(video_id), INFLIGHT_LOCK_TTL)
+    pipe.execute()
+
+
+def release_video(video_id: str, task_id: str) -> dict:
+    """
+    Releases the claim held by `task_id` and returns the attached waiters as
+    {user_id: youtube_url}. Returns {} if the claim is held by another task.
+    """
+    flat = RELEASE_SCRIPT(keys=[_lock_key(video_id), _waiters_key(video_id)], args=[task_id])
+    return dict(zip(flat[::2], flat[1::2]))
+
+
+def refresh_claim(video_id: str, task_id: str) -> bool:
+    """
+    Resets the TTL of the claim held by `task_id`. Returns False if the
+    claim is held by another task (or has expired). Redis errors are logged,
+    not raised, so they never fail a stage.
+    """
+    try:
+        refreshed = bool(REFRESH_SCRIPT(keys=[_lock_key(video_id), _waiters_key(video_id)],
+                                        args=[task_id, INFLIGHT_LOCK_TTL * 1000]))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to refresh the in-flight claim for video_id={video_id}: {str(e)}")
+        return True
+    if not refreshed:
+        logger.warning(f"Task {task_id} no longer holds the in-flight claim for video_id={video_id}")
+    return refreshed
+
+
+@contextmanager
+def hold_claim(video_id: str, task_id: str):
+    """
+    Keeps the claim of `task_id` alive while the enclosed block runs,
+    refreshing it every third of INFLIGHT_LOCK_TTL from a background thread.
+    """
+    stop = threading.Event()
+
+    def heartbeat():
+        while refresh_claim(video_id, task_id) and not stop.wait(INFLIGHT_LOCK_TTL / 3):
+            pass
+
+    thread = threading.Thread(target=heartbeat, name=f"inflight-{video_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,139 @@
+# metadata.py
+"""
+Video metadata (title, thumbnail, duration) for ingest.
+
+The watch page is several hundred KB, but the title is in its <head> and the
+duration is in the player config near the top of the body, so the page is
+streamed and scanned chunk by chunk, and the connection is dropped as soon
+as both are found (or after METADATA_MAX_BYTES). If the title can't be read
+from the page, YouTube's oEmbed endpoint is tried instead. The thumbnail URL
+doesn't need a request. Results are cached in Redis per video ID for
+METADATA_CACHE_TTL seconds.
+"""
+import os
+import re
+import json
+import html
+import logging
+
+import redis
+import requests
+
+from agent.clients import get_redis
+from agent.video import VideoRef
+
+logger = logging.getLogger(__name__)
+
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", str(30 * 24 * 3600)))
+METADATA_MAX_BYTES = int(os.getenv("METADATA_MAX_BYTES", str(1024 * 1024)))
+METADATA_TIMEOUT = float(os.getenv("METADATA_TIMEOUT", "10"))
+
+TITLE_NOT_FOUND = "Title not found."
+
+OEMBED_URL = "https://www.youtube.com/oembed"
+PLAYLIST_URL = "https://www.youtube.com/playlist"
+
+TITLE_PATTERN = re.compile(r'<meta name="title" content="([^"]*)"')
+LENGTH_SECONDS_PATTERN = re.compile(r'"lengthSeconds":"(\d+)"')
+PLAYLIST_VIDEO_PATTERN = re.compile(r'"playlistVideoRenderer":\{"videoId":"([A-Za-z0-9_-]{11})"')
+ISO_DURATION_PATTERN = re.compile(r'<meta itemprop="duration" content="PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?"')
+
+# Matches can straddle chunk boundaries, so this much of the previous chunk is rescanned
+SCAN_OVERLAP = 512
+
+
+def _cache_key(video_id: str) -> str:
+    return f"video_meta:{video_id}"
+
+
+def _match_duration(text: str):
+    match = LENGTH_SECONDS_PATTERN.search(text)
+    if match:
+        return int(match.group(1))
+    match = ISO_DURATION_PATTERN.search(text)
+    if match:
+        hours, minutes, seconds = (int(part or 0) for part in match.groups())
+        return hours * 3600 + minutes * 60 + seconds
+    return None
+
+
+def scrape_watch_page(video: VideoRef) -> dict:
+    """
+    Streams the watch page and returns {"title", "duration"} (either may be
+    None), reading only as far as needed to find both.
+    """
+    title, duration = None, None
+    with requests.get(video.url, stream=True, timeout=METADATA_TIMEOUT) as response:
+        if response.status_code != 200:
+            logger.warning(f"Failed to retrieve the video page for video_id={video.video_id}: {response.status_code}")
+            return {"title": None, "duration": None}
+
+        window, read = "", 0
+        for chunk in response.iter_content(chunk_size=16 * 1024, decode_unicode=True):
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode("utf-8", errors="ignore")
+            window = window[-SCAN_OVERLAP:] + chunk
+            read += len(chunk)
+            if title is None:
+                match = TITLE_PATTERN.search(window)
+                if match:
+                    title = html.unescape(match.group(1))
+            if duration is None:
+                duration = _match_duration(window)
+            if (title is not None and duration is not None) or read >= METADATA_MAX_BYTES:
+                break
+    return {"title": title, "duration": duration}
+
+
+def fetch_oembed_title(video: VideoRef):
+    """Title from YouTube's oEmbed endpoint, or None."""
+    response = requests.get(OEMBED_URL, params={"url": video.url, "format": "json"}, timeout=METADATA_TIMEOUT)
+    if response.status_code != 200:
+        return None
+    return response.json().get("title")
+
+
+def fetch_video_metadata(video: VideoRef) -> dict:
+    """
+    Returns {"title", "thumbnail", "duration"} for a video, from the cache if
+    possible. The title falls back to "Title not found." and the duration
+    (in seconds) to None; fallback results are not cached.
+    """
+    key = _cache_key(video.video_id)
+    try:
+        cached = get_redis().get(key)
+        if cached:
+            return json.loads(cached)
+    except redis.RedisError as e:
+        logger.warning(f"Metadata cache lookup failed for video_id={video.video_id}: {str(e)}")
+
+    scraped = {"title": None, "duration": None}
+    try:
+        scraped = scrape_watch_page(video)
+        if not scraped["title"]:
+            scraped["title"] = fetch_oembed_title(video)
+    except requests.RequestException as e:
+        logger.warning(f"Metadata fetch failed for video_id={video.video_id}: {str(e)}")
+
+    metadata = {
+        "title": scraped["title"] or TITLE_NOT_FOUND,
+        "thumbnail": video.thumbnail_url,
+        "duration": scraped["duration"],
+    }
+    if scraped["title"]:
+        try:
+            get_redis().set(key, json.dumps(metadata), ex=METADATA_CACHE_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"Metadata cache write failed for video_id={video.video_id}: {str(e)}")
+    return metadata
+
+
+def fetch_playlist_video_ids(playlist_id: str) -> list:
+    """
+    Returns the video IDs of a public playlist, in playlist order. Only the
+    videos embedded in the playlist page are returned (YouTube serves the
+    first 100; later ones are loaded by script).
+    """
+    response = requests.get(PLAYLIST_URL, params={"list": playlist_id}, timeout=METADATA_TIMEOUT)
+    response.raise_for_status()
+    return list(dict.fromkeys(PLAYLIST_VIDEO_PATTERN.findall(response.text)))
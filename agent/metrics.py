@@ -0,0 +1,275 @@
+# metrics.py
+"""
+Pipeline instrumentation shared by the API and the workers.
+
+  - `span(stage)` / `aspan(stage)` time a block of work. Each span is
+    logged as one key=value line and counted in a per-stage latency
+    histogram (plus an error count when the block raises).
+  - `record_tokens(model, prompt_tokens, completion_tokens)` adds to
+    per-model OpenAI token and request counters and to an estimated cost
+    (OPENAI_PRICES, USD per million tokens).
+  - `render_prometheus()` renders all of the above, the Celery queue
+    depths, the rate limiter's queueing delay and the embedding cache
+    counters in the Prometheus text format, for the API's /metrics endpoint.
+
+The histograms and counters live in Redis, so the API reports what every
+worker measured. Like the other Redis-backed helpers, recording fails open.
+"""
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager, asynccontextmanager
+
+import redis
+
+from agent.clients import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Celery queues whose backlog is reported as ytcrew_celery_queue_depth
+METRICS_QUEUES = [queue for queue in os.getenv("METRICS_QUEUES", "celery,bulk").split(",") if queue]
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+STAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# USD per million tokens
+DEFAULT_OPENAI_PRICES = {
+    "text-embedding-ada-002": {"prompt": 0.10, "completion": 0.0},
+    "gpt-3.5-turbo": {"prompt": 0.50, "completion": 1.50},
+    "gpt-4o-mini": {"prompt": 0.15, "completion": 0.60},
+    "gpt-4.1-mini": {"prompt": 0.40, "completion": 1.60},
+}
+OPENAI_PRICES = {**DEFAULT_OPENAI_PRICES, **json.loads(os.getenv("OPENAI_PRICES", "{}"))}
+
+# Celery's Redis transport keeps each non-zero priority level in its own list
+CELERY_PRIORITY_SEPARATOR = "\x06\x16"
+CELERY_PRIORITY_STEPS = (3, 6, 9)
+
+STAGES_KEY = "metrics:stages"
+MODELS_KEY = "metrics:models"
+
+
+def _stage_key(stage: str) -> str:
+    return f"metrics:stage:{stage}"
+
+
+def _tokens_key(model: str) -> str:
+    return f"metrics:tokens:{model}"
+
+
+def _bucket_field(seconds: float) -> str:
+    for bound in STAGE_BUCKETS:
+        if seconds <= bound:
+            return f"le:{bound}"
+    return "le:+Inf"
+
+
+def _stage_pipeline(pipe, stage: str, seconds: float, status: str):
+    key = _stage_key(stage)
+    pipe.sadd(STAGES_KEY, stage)
+    pipe.hincrby(key, "count", 1)
+    pipe.hincrbyfloat(key, "sum", seconds)
+    pipe.hincrby(key, _bucket_field(seconds), 1)
+    if status != "ok":
+        pipe.hincrby(key, "errors", 1)
+    return pipe
+
+
+def _log_span(stage: str, seconds: float, status: str, attrs: dict):
+    fields = " ".join(f"{key}={value}" for key, value in attrs.items())
+    logger.info(f"span stage={stage} duration_ms={seconds * 1000:.1f} status={status} {fields}".rstrip())
+
+
+def observe_stage(stage: str, seconds: float, status: str = "ok", **attrs):
+    """Records one timed run of `stage`."""
+    _log_span(stage, seconds, status, attrs)
+    if not METRICS_ENABLED:
+        return
+    try:
+        _stage_pipeline(get_redis().pipeline(), stage, seconds, status).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record metrics for stage {stage}: {str(e)}")
+
+
+async def aobserve_stage(stage: str, seconds: float, status: str = "ok", **attrs):
+    """Async version of `observe_stage`."""
+    _log_span(stage, seconds, status, attrs)
+    if not METRICS_ENABLED:
+        return
+    try:
+        await _stage_pipeline(get_async_redis().pipeline(), stage, seconds, status).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record metrics for stage {stage}: {str(e)}")
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Times the enclosed block as one run of `stage`; extra `attrs` are logged with it."""
+    start, status = time.perf_counter(), "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, status, **attrs)
+
+
+@asynccontextmanager
+async def aspan(stage: str, **attrs):
+    """Async version of `span`, for request handlers."""
+    start, status = time.perf_counter(), "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        await aobserve_stage(stage, time.perf_counter() - start, status, **attrs)
+
+
+def token_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of a call, or 0.0 for models without a price."""
+    prices = OPENAI_PRICES.get(model)
+    if not prices:
+        return 0.0
+    return (prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]) / 1e6
+
+
+def _tokens_pipeline(pipe, model: str, prompt_tokens, completion_tokens, requests: int = 1):
+    prompt_tokens, completion_tokens = int(prompt_tokens or 0), int(completion_tokens or 0)
+    pipe.sadd(MODELS_KEY, model)
+    pipe.hincrby(_tokens_key(model), "requests", requests)
+    pipe.hincrby(_tokens_key(model), "prompt", prompt_tokens)
+    pipe.hincrby(_tokens_key(model), "completion", completion_tokens)
+    pipe.hincrbyfloat(_tokens_key(model), "cost_usd", token_cost(model, prompt_tokens, completion_tokens))
+    return pipe
+
+
+def record_tokens(model: str, prompt_tokens: int = 0, completion_tokens: int = 0, requests: int = 1):
+    """
+    Adds an OpenAI call's token usage (and its estimated cost) to the
+    model's counters; `requests` is how many calls the usage covers.
+    """
+    if not METRICS_ENABLED:
+        return
+    try:
+        _tokens_pipeline(get_redis().pipeline(), model, prompt_tokens, completion_tokens, requests).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record token usage for {model}: {str(e)}")
+
+
+async def arecord_tokens(model: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Async version of `record_tokens`."""
+    if not METRICS_ENABLED:
+        return
+    try:
+        await _tokens_pipeline(get_async_redis().pipeline(), model, prompt_tokens, completion_tokens).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record token usage for {model}: {str(e)}")
+
+
+def record_usage(model: str, usage):
+    """`record_tokens` from an OpenAI response's `usage` (a no-op when it has none)."""
+    if usage is None:
+        return
+    record_tokens(model, getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+
+async def arecord_usage(model: str, usage):
+    """Async version of `record_usage`."""
+    if usage is None:
+        return
+    await arecord_tokens(model, getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+
+def queue_depths() -> dict:
+    """Number of tasks waiting in each of METRICS_QUEUES (all priority levels)."""
+    pipe = get_redis().pipeline()
+    for queue in METRICS_QUEUES:
+        pipe.llen(queue)
+        for priority in CELERY_PRIORITY_STEPS:
+            pipe.llen(f"{queue}{CELERY_PRIORITY_SEPARATOR}{priority}")
+    lengths = pipe.execute()
+    per_queue = len(CELERY_PRIORITY_STEPS) + 1
+    return {queue: sum(lengths[i * per_queue:(i + 1) * per_queue]) for i, queue in enumerate(METRICS_QUEUES)}
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    from agent.rate_limit import rate_limit_stats
+    from agent.embedding_cache import embedding_cache_stats
+
+    lines = [
+        "# HELP ytcrew_stage_duration_seconds Duration of pipeline and request stages.",
+        "# TYPE ytcrew_stage_duration_seconds histogram",
+    ]
+    errors = []
+    for stage in sorted(get_redis().smembers(STAGES_KEY)):
+        raw = get_redis().hgetall(_stage_key(stage))
+        cumulative = 0
+        for bound in STAGE_BUCKETS + ("+Inf",):
+            cumulative += int(raw.get(f"le:{bound}", 0))
+            lines.append(f'ytcrew_stage_duration_seconds_bucket{{stage="{_label(stage)}",le="{bound}"}} {cumulative}')
+        lines.append(f'ytcrew_stage_duration_seconds_sum{{stage="{_label(stage)}"}} {float(raw.get("sum", 0.0))}')
+        lines.append(f'ytcrew_stage_duration_seconds_count{{stage="{_label(stage)}"}} {int(raw.get("count", 0))}')
+        errors.append(f'ytcrew_stage_errors_total{{stage="{_label(stage)}"}} {int(raw.get("errors", 0))}')
+    lines += [
+        "# HELP ytcrew_stage_errors_total Stage runs that raised.",
+        "# TYPE ytcrew_stage_errors_total counter",
+        *errors,
+    ]
+
+    requests, tokens, costs = [], [], []
+    for model in sorted(get_redis().smembers(MODELS_KEY)):
+        raw = get_redis().hgetall(_tokens_key(model))
+        requests.append(f'ytcrew_openai_requests_total{{model="{_label(model)}"}} {int(raw.get("requests", 0))}')
+        for kind in ("prompt", "completion"):
+            tokens.append(f'ytcrew_openai_tokens_total{{model="{_label(model)}",kind="{kind}"}} {int(raw.get(kind, 0))}')
+        costs.append(f'ytcrew_openai_cost_usd_total{{model="{_label(model)}"}} {float(raw.get("cost_usd", 0.0))}')
+    lines += [
+        "# HELP ytcrew_openai_requests_total OpenAI calls with recorded token usage.",
+        "# TYPE ytcrew_openai_requests_total counter",
+        *requests,
+        "# HELP ytcrew_openai_tokens_total OpenAI tokens used, by model and prompt/completion.",
+        "# TYPE ytcrew_openai_tokens_total counter",
+        *tokens,
+        "# HELP ytcrew_openai_cost_usd_total Estimated OpenAI spend in USD.",
+        "# TYPE ytcrew_openai_cost_usd_total counter",
+        *costs,
+        "# HELP ytcrew_celery_queue_depth Tasks waiting in a Celery queue.",
+        "# TYPE ytcrew_celery_queue_depth gauge",
+        *(f'ytcrew_celery_queue_depth{{queue="{_label(queue)}"}} {depth}' for queue, depth in queue_depths().items()),
+    ]
+
+    limiter = rate_limit_stats()
+    lines += [
+        "# HELP ytcrew_rate_limit_wait_seconds_total Time OpenAI calls spent queued by the rate limiter.",
+        "# TYPE ytcrew_rate_limit_wait_seconds_total counter",
+        *(f'ytcrew_rate_limit_wait_seconds_total{{model="{_label(model)}"}} {stats["wait_seconds"]}'
+          for model, stats in limiter.items()),
+        "# HELP ytcrew_rate_limited_total OpenAI 429 responses.",
+        "# TYPE ytcrew_rate_limited_total counter",
+        *(f'ytcrew_rate_limited_total{{model="{_label(model)}"}} {stats["rate_limited"]}'
+          for model, stats in limiter.items()),
+    ]
+
+    cache = embedding_cache_stats()
+    # The counters live in Redis; without it there is nothing to export
+    if cache["enabled"] and cache.get("redis") != "unavailable":
+        lines += [
+            "# HELP ytcrew_embedding_cache_lookups_total Embedding cache lookups by outcome.",
+            "# TYPE ytcrew_embedding_cache_lookups_total counter",
+            *(f'ytcrew_embedding_cache_lookups_total{{result="{result}"}} {cache[counter]}'
+              for result, counter in (("local_hit", "local_hits"), ("redis_hit", "redis_hits"), ("miss", "misses"))),
+            "# HELP ytcrew_embedding_cache_redis_errors_total Embedding cache Redis errors.",
+            "# TYPE ytcrew_embedding_cache_redis_errors_total counter",
+            f"ytcrew_embedding_cache_redis_errors_total {cache['redis_errors']}",
+        ]
+    return "\n".join(lines) + "\n"
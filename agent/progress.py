@@ -0,0 +1,101 @@
+# progress.py
+"""
+Task progress events over Redis pub/sub.
+
+Workers publish each stage of a video task as it finishes (transcript
+fetched, summarized, N/M chunks embedded, metadata fetched, completed or
+failed) to the channel `progress:<task_id>`. Every event is also appended to
+the list `progress:<task_id>:events`, so a client that subscribes late still
+gets what it missed. Events carry a sequence number (their position in that
+list) so replayed and live copies can be de-duplicated.
+"""
+import os
+import json
+import time
+import logging
+
+import redis
+
+from agent.clients import get_async_redis, RedisScript
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", "3600"))
+
+# Stages after which a task publishes nothing more
+TERMINAL_STAGES = ("completed", "failed")
+
+# Append the event with its sequence number, then publish it, atomically
+PUBLISH_SCRIPT = RedisScript("""
+local event = cjson.decode(ARGV[1])
+event['seq'] = redis.call('LLEN', KEYS[1]) + 1
+local encoded = cjson.encode(event)
+redis.call('RPUSH', KEYS[1], encoded)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('PUBLISH', KEYS[2], encoded)
+return event['seq']
+""")
+
+
+def _channel(task_id: str) -> str:
+    return f"progress:{task_id}"
+
+
+def _events_key(task_id: str) -> str:
+    return f"progress:{task_id}:events"
+
+
+def publish_progress(task_id: str, stage: str, **data):
+    """
+    Publishes a progress event {"stage", "time", **data} for a task. Errors
+    are logged and swallowed: progress is best-effort and must never fail
+    the task.
+    """
+    if not task_id:
+        return
+    event = {"stage": stage, "time": time.time(), **data}
+    try:
+        PUBLISH_SCRIPT(keys=[_events_key(task_id), _channel(task_id)], args=[json.dumps(event), PROGRESS_TTL])
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish progress for task_id={task_id}: {str(e)}")
+
+
+async def subscribe_progress(task_id: str, keepalive: float = 15.0):
+    """
+    Async generator of a task's progress events: first the ones already
+    published, then live ones, ending after a terminal event. Yields None
+    after `keepalive` seconds without an event so callers can keep the
+    connection open.
+    """
+    pubsub = get_async_redis().pubsub()
+    # Subscribe before reading the history so nothing published in between is lost
+    await pubsub.subscribe(_channel(task_id))
+    try:
+        last_seq = 0
+        for raw in await get_async_redis().lrange(_events_key(task_id), 0, -1):
+            event = json.loads(raw)
+            last_seq = event["seq"]
+            yield event
+            if event["stage"] in TERMINAL_STAGES:
+                return
+
+        idle_since = time.monotonic()
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=keepalive)
+            if message is None:
+                # Also returned for skipped subscribe confirmations, so check the clock
+                if time.monotonic() - idle_since >= keepalive:
+                    idle_since = time.monotonic()
+                    yield None
+                continue
+            idle_since = time.monotonic()
+            event = json.loads(message["data"])
+            if event["seq"] <= last_seq:
+                continue
+            last_seq = event["seq"]
+            yield event
+            if event["stage"] in TERMINAL_STAGES:
+                return
+    finally:
+        await pubsub.unsubscribe(_channel(task_id))
+        await pubsub.aclose()
@@ -0,0 +1,397 @@
+# rate_limit.py
+"""
+Distributed OpenAI rate limiter shared by the API and every Celery worker.
+
+Each model has two token buckets in Redis, refilled continuously: one for
+requests per minute and one for tokens per minute. Before a call, `acquire`
+(or `aacquire` in async code) takes one request plus the call's estimated
+tokens, sleeping for exactly as long as the buckets need to refill if they
+are short. The buckets live in a Lua script run against Redis' clock, so
+all processes draw from the same budget.
+
+The limiter also adapts to what OpenAI reports:
+  - `x-ratelimit-remaining-*` response headers lower the buckets to the
+    provider's view when it is tighter than ours;
+  - when a limit reaches zero, or a call gets a 429, every process pauses
+    the model until the reported reset / retry-after time (or an
+    exponential backoff when no header says how long).
+
+Per-model limits default to DEFAULT_RATE_LIMITS and can be overridden with
+OPENAI_RATE_LIMITS, e.g. '{"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}'.
+Redis errors fail open so a Redis outage never blocks OpenAI calls.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+
+import redis
+
+from agent.clients import get_redis, get_async_redis, RedisScript
+from agent.metrics import record_usage, arecord_usage
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Longest single sleep before re-checking the buckets
+RATE_LIMIT_MAX_SLEEP = float(os.getenv("RATE_LIMIT_MAX_SLEEP", "5"))
+# Pause after a 429 without a retry-after header, doubled per consecutive 429
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", "1"))
+
+DEFAULT_RATE_LIMITS = {
+    "text-embedding-ada-002": {"rpm": 3000, "tpm": 1000000},
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 200000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    # The crew's default model
+    "gpt-4.1-mini": {"rpm": 500, "tpm": 200000},
+}
+DEFAULT_MODEL_LIMIT = {"rpm": 500, "tpm": 200000}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("OPENAI_RATE_LIMITS", "{}"))}
+
+MODELS_KEY = "ratelimit:models"
+
+# Take one request and ARGV[3] tokens; returns seconds to wait ("0" means the request and tokens were taken)
+ACQUIRE_SCRIPT = RedisScript("""
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local pause_until = tonumber(redis.call('GET', KEYS[2]) or '0')
+if pause_until > now then
+    return tostring(pause_until - now)
+end
+local rpm, tpm, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+if cost > tpm then
+    cost = tpm
+end
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts')
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+local wait = 0
+if requests < 1 then
+    wait = (1 - requests) * 60 / rpm
+end
+if tokens < cost then
+    wait = math.max(wait, (cost - tokens) * 60 / tpm)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+""")
+
+# Lowers the buckets to the provider-reported remaining budget (never raises them)
+SYNC_SCRIPT = RedisScript("""
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens')
+if ARGV[1] ~= '' and tonumber(state[1]) and tonumber(ARGV[1]) < tonumber(state[1]) then
+    redis.call('HSET', KEYS[1], 'requests', ARGV[1])
+end
+if ARGV[2] ~= '' and tonumber(state[2]) and tonumber(ARGV[2]) < tonumber(state[2]) then
+    redis.call('HSET', KEYS[1], 'tokens', ARGV[2])
+end
+return 0
+""")
+
+# Pauses the model for ARGV[1] seconds from now, unless already paused for longer
+PAUSE_SCRIPT = RedisScript("""
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local pause_until = now + tonumber(ARGV[1])
+if pause_until > tonumber(redis.call('GET', KEYS[1]) or '0') then
+    redis.call('SET', KEYS[1], tostring(pause_until), 'PX', math.ceil(tonumber(ARGV[1]) * 1000) + 1000)
+end
+return 0
+""")
+
+# The async client needs its own handles on the scripts
+ASYNC_ACQUIRE_SCRIPT = RedisScript(ACQUIRE_SCRIPT.script, asynchronous=True)
+ASYNC_SYNC_SCRIPT = RedisScript(SYNC_SCRIPT.script, asynchronous=True)
+ASYNC_PAUSE_SCRIPT = RedisScript(PAUSE_SCRIPT.script, asynchronous=True)
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def _bucket_key(model: str) -> str:
+    return f"ratelimit:{model}:bucket"
+
+
+def _pause_key(model: str) -> str:
+    return f"ratelimit:{model}:pause_until"
+
+
+def _strikes_key(model: str) -> str:
+    return f"ratelimit:{model}:strikes"
+
+
+def _stats_key(model: str) -> str:
+    return f"ratelimit:{model}:stats"
+
+
+def model_limits(model: str) -> dict:
+    return RATE_LIMITS.get(model, DEFAULT_MODEL_LIMIT)
+
+
+def parse_duration(value: str):
+    """Parses OpenAI reset durations such as "1s", "6m0s" or "20ms" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _acquire_args(model: str, tokens: int) -> dict:
+    limits = model_limits(model)
+    return {"keys": [_bucket_key(model), _pause_key(model)], "args": [limits["rpm"], limits["tpm"], max(0, int(tokens))]}
+
+
+def _stats_pipeline(pipe, model: str, delay: float):
+    pipe.sadd(MODELS_KEY, model)
+    pipe.hincrby(_stats_key(model), "acquired", 1)
+    if delay > 0:
+        pipe.hincrby(_stats_key(model), "delayed", 1)
+        pipe.hincrbyfloat(_stats_key(model), "wait_seconds", delay)
+    return pipe
+
+
+def _record_wait(model: str, delay: float):
+    try:
+        _stats_pipeline(get_redis().pipeline(), model, delay).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record rate limiter stats for {model}: {str(e)}")
+
+
+def acquire(model: str, tokens: int = 0) -> float:
+    """
+    Blocks until one request and `tokens` tokens are available for `model`.
+    Returns the time spent waiting, in seconds.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    start, waited = time.monotonic(), False
+    while True:
+        try:
+            wait = float(ACQUIRE_SCRIPT(**_acquire_args(model, tokens)))
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, not limiting {model}: {str(e)}")
+            return 0.0
+        if wait <= 0:
+            break
+        waited = True
+        time.sleep(min(wait, RATE_LIMIT_MAX_SLEEP))
+    delay = time.monotonic() - start if waited else 0.0
+    _record_wait(model, delay)
+    return delay
+
+
+async def aacquire(model: str, tokens: int = 0) -> float:
+    """Async version of `acquire`; sleeps without blocking the event loop."""
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    start, waited = time.monotonic(), False
+    while True:
+        try:
+            wait = float(await ASYNC_ACQUIRE_SCRIPT(**_acquire_args(model, tokens)))
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, not limiting {model}: {str(e)}")
+            return 0.0
+        if wait <= 0:
+            break
+        waited = True
+        await asyncio.sleep(min(wait, RATE_LIMIT_MAX_SLEEP))
+    delay = time.monotonic() - start if waited else 0.0
+    try:
+        await _stats_pipeline(get_async_redis().pipeline(), model, delay).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record rate limiter stats for {model}: {str(e)}")
+    return delay
+
+
+def _header_limits(headers):
+    """(remaining requests, remaining tokens, seconds to pause) from x-ratelimit-* headers."""
+    remaining_requests = headers.get("x-ratelimit-remaining-requests")
+    remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+    pause = 0.0
+    if remaining_requests == "0":
+        pause = max(pause, parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0)
+    if remaining_tokens == "0":
+        pause = max(pause, parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0)
+    return remaining_requests, remaining_tokens, pause
+
+
+def _rate_limited_pause(strikes: int, headers) -> float:
+    retry_after = parse_duration((headers or {}).get("retry-after"))
+    return retry_after if retry_after is not None else RATE_LIMIT_BACKOFF * 2 ** min(strikes - 1, 6)
+
+
+def observe_headers(model: str, headers):
+    """
+    Adapts the buckets to OpenAI's x-ratelimit-* response headers, and
+    pauses the model until the reset time of any limit that is exhausted.
+    """
+    if not RATE_LIMIT_ENABLED or headers is None:
+        return
+    remaining_requests, remaining_tokens, pause = _header_limits(headers)
+    try:
+        if remaining_requests is not None or remaining_tokens is not None:
+            SYNC_SCRIPT(keys=[_bucket_key(model)], args=[remaining_requests or "", remaining_tokens or ""])
+        if pause > 0:
+            PAUSE_SCRIPT(keys=[_pause_key(model)], args=[pause])
+        get_redis().delete(_strikes_key(model))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to apply rate limit headers for {model}: {str(e)}")
+
+
+async def aobserve_headers(model: str, headers):
+    """Async version of `observe_headers`."""
+    if not RATE_LIMIT_ENABLED or headers is None:
+        return
+    remaining_requests, remaining_tokens, pause = _header_limits(headers)
+    try:
+        if remaining_requests is not None or remaining_tokens is not None:
+            await ASYNC_SYNC_SCRIPT(keys=[_bucket_key(model)], args=[remaining_requests or "", remaining_tokens or ""])
+        if pause > 0:
+            await ASYNC_PAUSE_SCRIPT(keys=[_pause_key(model)], args=[pause])
+        await get_async_redis().delete(_strikes_key(model))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to apply rate limit headers for {model}: {str(e)}")
+
+
+def observe_rate_limited(model: str, headers=None):
+    """
+    Pauses every process' calls to `model` after a 429: for the
+    retry-after time if the response gave one, else for an exponential
+    backoff over consecutive 429s.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    try:
+        strikes = get_redis().incr(_strikes_key(model))
+        get_redis().expire(_strikes_key(model), 300)
+        pause = _rate_limited_pause(strikes, headers)
+        PAUSE_SCRIPT(keys=[_pause_key(model)], args=[pause])
+        get_redis().hincrby(_stats_key(model), "rate_limited", 1)
+        logger.warning(f"OpenAI rate limited {model}; pausing all callers for {pause:.1f}s")
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record rate limiting for {model}: {str(e)}")
+
+
+async def aobserve_rate_limited(model: str, headers=None):
+    """Async version of `observe_rate_limited`."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    try:
+        strikes = await get_async_redis().incr(_strikes_key(model))
+        await get_async_redis().expire(_strikes_key(model), 300)
+        pause = _rate_limited_pause(strikes, headers)
+        await ASYNC_PAUSE_SCRIPT(keys=[_pause_key(model)], args=[pause])
+        await get_async_redis().hincrby(_stats_key(model), "rate_limited", 1)
+        logger.warning(f"OpenAI rate limited {model}; pausing all callers for {pause:.1f}s")
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record rate limiting for {model}: {str(e)}")
+
+
+def limited_call(model: str, tokens: int, create, **kwargs):
+    """
+    Rate-limited OpenAI call. `create` is a `with_raw_response.create`
+    method so the rate-limit headers can be read; returns the parsed response
+    after recording its token usage.
+    """
+    # Deferred so the API's cold start doesn't pay for the SDK; whoever
+    # passes `create` has already imported it through agent.clients
+    import openai
+    acquire(model, tokens)
+    try:
+        raw = create(model=model, **kwargs)
+    except openai.RateLimitError as e:
+        observe_rate_limited(model, e.response.headers)
+        raise
+    observe_headers(model, raw.headers)
+    response = raw.parse()
+    record_usage(model, getattr(response, "usage", None))
+    return response
+
+
+async def alimited_call(model: str, tokens: int, create, **kwargs):
+    """Async version of `limited_call`."""
+    import openai
+    await aacquire(model, tokens)
+    try:
+        raw = await create(model=model, **kwargs)
+    except openai.RateLimitError as e:
+        await aobserve_rate_limited(model, e.response.headers)
+        raise
+    await aobserve_headers(model, raw.headers)
+    response = raw.parse()
+    # Streams report usage in their last chunk; their consumer records it
+    await arecord_usage(model, getattr(response, "usage", None))
+    return response
+
+
+def rate_limit_stats() -> dict:
+    """Per-model acquisitions, how many had to wait, total/average queueing delay and 429 count."""
+    stats = {}
+    for model in sorted(get_redis().smembers(MODELS_KEY)):
+        raw = get_redis().hgetall(_stats_key(model))
+        acquired = int(raw.get("acquired", 0))
+        wait_seconds = float(raw.get("wait_seconds", 0.0))
+        stats[model] = {
+            "acquired": acquired,
+            "delayed": int(raw.get("delayed", 0)),
+            "wait_seconds": wait_seconds,
+            "avg_wait_seconds": wait_seconds / acquired if acquired else 0.0,
+            "rate_limited": int(raw.get("rate_limited", 0)),
+            "limits": model_limits(model),
+        }
+    return stats
+
+
+def _model_name(model: str) -> str:
+    # litellm model names may carry a provider prefix ("openai/gpt-4o-mini")
+    return model.split("/", 1)[-1]
+
+
+def install_litellm_hooks():
+    """
+    Routes the crew's LLM calls (made through litellm) through the limiter:
+    acquiring before each call and backing off on 429s. The crew records
+    their token usage itself. Registered once per process and returned, so
+    callers that replace litellm's callback list (crewai does on every
+    agent call) can pass it along; None without litellm. litellm is
+    imported here because only the crew needs it.
+    """
+    try:
+        import litellm
+        from litellm.integrations.custom_logger import CustomLogger
+    except ImportError:
+        logger.warning("litellm is not installed; crew LLM calls are not rate limited")
+        return None
+
+    class LiteLLMHooks(CustomLogger):
+        def log_pre_api_call(self, model, messages, kwargs):
+            prompt_chars = sum(len(str(message.get("content") or "")) for message in messages or [])
+            max_tokens = (kwargs.get("optional_params") or {}).get("max_tokens") or 1024
+            acquire(_model_name(model), prompt_chars // 4 + max_tokens)
+
+        def log_failure_event(self, kwargs, response_obj, start_time, end_time):
+            if isinstance(kwargs.get("exception"), litellm.RateLimitError):
+                observe_rate_limited(_model_name(kwargs.get("model", "")))
+
+    for callback in litellm.callbacks:
+        if type(callback).__name__ == "LiteLLMHooks":
+            return callback
+    hooks = LiteLLMHooks()
+    litellm.callbacks.append(hooks)
+    return hooks
@@ -0,0 +1,52 @@
+# stage_data.py
+"""
+Redis hand-off for the bulky outputs of a video's pipeline stages.
+
+The transcript segments and the chunks are far larger than anything else a
+stage produces, and returning them would send them through the Celery result
+backend once per consuming stage. Instead the producing stage saves them
+here, compressed like the stored transcript, under
+`stage:<task_id>:<name>`, and the stages that need them load them by task
+ID. Entries expire after STAGE_DATA_TTL seconds; `finalize_stage` and the
+pipeline's error callback delete them as soon as the pipeline is done.
+"""
+import os
+import json
+
+from agent.clients import get_redis
+from agent.artifacts import compress_text, decompress_text
+
+STAGE_DATA_TTL = int(os.getenv("STAGE_DATA_TTL", "86400"))
+
+# Every kind of data a stage hands off, so a pipeline's entries can be dropped together
+STAGE_DATA_NAMES = ("segments", "chunks")
+
+
+def _key(task_id: str, name: str) -> str:
+    return f"stage:{task_id}:{name}"
+
+
+def save_stage_data(task_id: str, name: str, value):
+    """Stores the JSON-serializable `value` as `name` for the pipeline of `task_id`."""
+    blob = compress_text(json.dumps(value))
+    # The compressed payloads are binary, so these go through the undecoded client
+    pipe = get_redis(decode_responses=False).pipeline()
+    pipe.hset(_key(task_id, name), mapping=blob)
+    pipe.expire(_key(task_id, name), STAGE_DATA_TTL)
+    pipe.execute()
+
+
+def load_stage_data(task_id: str, name: str):
+    """
+    Returns the value saved as `name` for the pipeline of `task_id`. Raises
+    ValueError if there is none (it expired or the pipeline already finished).
+    """
+    blob = get_redis(decode_responses=False).hgetall(_key(task_id, name))
+    if not blob:
+        raise ValueError(f"No {name} stage data for task {task_id}; it may have expired")
+    return json.loads(decompress_text({"codec": blob[b"codec"].decode(), "data": blob[b"data"]}))
+
+
+def clear_stage_data(task_id: str):
+    """Deletes everything the pipeline of `task_id` handed off."""
+    get_redis(decode_responses=False).delete(*(_key(task_id, name) for name in STAGE_DATA_NAMES))
@@ -1,18 +1,34 @@
 import os
-import json
 import logging
+import time
+import uuid
 import requests
-import re
-from bs4 import BeautifulSoup
-
-from celery import Celery
-from pymongo import MongoClient
-from bson import ObjectId
-
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
-
-from crew import YTSummaryCrew
+import redis
+
+from celery import Celery, chain, chord
+from celery.result import AsyncResult
+from celery.signals import worker_process_init, worker_process_shutdown
+from pymongo.errors import PyMongoError
+
+from agent.embedding_cache import embedding_cache
+from agent.video import VideoRef
+from agent.artifacts import (
+    find_video_artifacts, save_video_artifacts, link_blog_to_artifacts,
+    summary_vector_id, chunk_vector_id,
+)
+from agent.inflight import claim_or_take_over, add_waiter, release_video, refresh_claim, hold_claim
+from agent.stage_data import save_stage_data, load_stage_data, clear_stage_data
+from agent.batch import BULK_QUEUE, get_batch, take_next_item, update_item, release_slot, finish_item
+from agent.vector_store import get_vector_store
+from agent.answer_cache import invalidate_video
+from agent.chunking import chunk_segments
+from agent.metadata import fetch_video_metadata
+from agent.progress import publish_progress
+from agent.rate_limit import limited_call
+from agent.metrics import span
+from agent.clients import (
+    get_db, get_openai_client, get_pinecone_index, reset_clients, close_clients,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -32,50 +48,22 @@ celery_app = Celery(
 )
 celery_app.conf.broker_connection_retry_on_startup = True
 
-# Connect to your MongoDB
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-DB_NAME = os.getenv("DB_NAME", "yt-crew")
+@worker_process_init.connect
+def _reset_clients_in_child(**kwargs):
+    # Prefork children must not reuse the parent's connections
+    reset_clients()
 
-# client = MongoClient(MONGO_URI)
-# db = client[DB_NAME]
-# blogs_collection = db["blogs"]
+@worker_process_shutdown.connect
+def _close_clients_on_shutdown(**kwargs):
+    close_clients()
 
 def get_blogs_collection():
     """
-    Creates a new MongoClient instance and returns the "blogs" collection.
-    Called at task runtime to avoid fork-safety issues.
+    Returns the "blogs" collection on the process' shared client (see `agent.clients`).
     """
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    return db["blogs"]
+    return get_db()["blogs"]
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(
-  api_key=os.environ['OPENAI_API_KEY'],
-)
-
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "youtube-summaries")
-PINECONE_CLOUD = os.getenv("PINECONE_CLOUD", "aws")
-PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
-existing_indexes = pc.list_indexes().names()
-
-# Create the index if it doesn't exist
-if PINECONE_INDEX_NAME not in existing_indexes:
-    pc.create_index(
-        name=PINECONE_INDEX_NAME,
-        dimension=1536,  # for text-embedding-ada-002
-        metric="cosine", # or "euclidean" / "dotproduct"
-        spec=ServerlessSpec(
-            cloud=PINECONE_CLOUD,
-            region=PINECONE_REGION
-        )
-    )
-
-# Connect to the index
-pinecone_index = pc.Index(PINECONE_INDEX_NAME)
+EMBEDDING_MODEL = "text-embedding-ada-002"
 
 def get_embedding(text: str) -> list:
     """
@@ -91,8 +79,15 @@ def get_embedding(text: str) -> list:
     if not text:
         raise ValueError("Input text is empty. Cannot generate embedding.")
 
-    # Generate the embedding with the new API parameter name 'model'
-    response = openai_client.embeddings.create(input=[text], model="text-embedding-ada-002")
+    # Serve repeated text from the embedding cache
+    if embedding_cache is not None:
+        cached = embedding_cache.get_many(EMBEDDING_MODEL, [text])
+        if text in cached:
+            return cached[text]
+
+    # Generate the embedding, within the shared OpenAI rate limit
+    response = limited_call(EMBEDDING_MODEL, estimate_tokens(text),
+                            get_openai_client().embeddings.with_raw_response.create, input=[text])
     
     # Validate response structure
     if not response.data or len(response.data) == 0:
@@ -105,152 +100,467 @@ def get_embedding(text: str) -> list:
     if not embedding or len(embedding) != expected_dimension:
         raise ValueError(f"Embedding dimension {len(embedding)} does not match the expected dimension {expected_dimension}.")
 
+    if embedding_cache is not None:
+        embedding_cache.set_many(EMBEDDING_MODEL, {text: embedding})
     return embedding
 
-def chunk_text_by_words(text: str, chunk_size: int = 500) -> list:
+# Batching limits for the embeddings endpoint. OpenAI caps a single request at
+# 2048 inputs; the token budget keeps each request comfortably below the
+# per-request token limit.
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+PINECONE_UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", "100"))
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "3"))
+
+def estimate_tokens(text: str) -> int:
     """
-    Splits `text` into chunks of roughly `chunk_size` words.
-    Skips empty/duplicate chunks.
+    Cheap token estimate (~4 characters per token for English text).
+    Only used to size batches, so it does not need to be exact.
     """
-    words = text.split()
-    chunks = []
-    current_chunk_words = []
-
-    for word in words:
-        current_chunk_words.append(word)
-        # If we've hit the chunk_size limit, finalize this chunk
-        if len(current_chunk_words) >= chunk_size:
-            chunk_str = " ".join(current_chunk_words).strip()
-            chunks.append(chunk_str)
-            current_chunk_words = []
-
-    # Handle any leftover words
-    if current_chunk_words:
-        chunk_str = " ".join(current_chunk_words).strip()
-        if chunk_str:
-            chunks.append(chunk_str)
-
-    # Remove duplicates and empty
-    unique_chunks = []
-    seen = set()
-    for chunk in chunks:
-        if chunk not in seen and chunk.strip():
-            unique_chunks.append(chunk)
-            seen.add(chunk)
-    return unique_chunks
+    return len(text) // 4 + 1
 
+def batch_texts_by_tokens(texts: list, max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS,
+                          max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS) -> list:
+    """
+    Packs `texts` into consecutive batches that stay under both `max_inputs`
+    items and `max_tokens` estimated tokens. Returns a list of index lists so
+    callers can map results back to the original positions.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for idx, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(idx)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _call_with_retries(fn, description: str, max_retries: int = BATCH_MAX_RETRIES):
+    """
+    Calls `fn()` and retries with exponential backoff on any exception.
+    Re-raises the last error once `max_retries` attempts have failed.
+    """
+    for attempt in range(1, max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 2 ** (attempt - 1)
+            logger.warning(f"{description} failed (attempt {attempt}/{max_retries}): {str(e)}; retrying in {delay}s")
+            time.sleep(delay)
 
-@celery_app.task
-def process_video_task(user_id: str, youtube_url: str) -> str:
+def get_embeddings(texts: list, on_progress=None) -> list:
+    """
+    Batched counterpart of `get_embedding`. Packs `texts` into token-bounded
+    requests and returns the embedding vectors in the same order as `texts`.
+    Each request is retried on failure; raises if a batch still fails.
+    `on_progress(done, total)` is called after each batch with how many of
+    `texts` have an embedding so far.
+    """
+    cleaned = []
+    for text in texts:
+        if not isinstance(text, str):
+            text = str(text)
+        text = text.strip()
+        if not text:
+            raise ValueError("Input text is empty. Cannot generate embedding.")
+        cleaned.append(text)
+
+    # Only texts missing from the cache are sent to OpenAI, each distinct text once
+    cached = embedding_cache.get_many(EMBEDDING_MODEL, cleaned) if embedding_cache is not None else {}
+    pending = list(dict.fromkeys(text for text in cleaned if text not in cached))
+
+    fresh = {}
+    expected_dimension = 1536
+    for batch in batch_texts_by_tokens(pending):
+        batch_input = [pending[i] for i in batch]
+        response = _call_with_retries(
+            lambda: limited_call(EMBEDDING_MODEL, sum(estimate_tokens(text) for text in batch_input),
+                                 get_openai_client().embeddings.with_raw_response.create, input=batch_input),
+            f"Embedding batch of {len(batch_input)} texts",
+        )
+        if not response.data or len(response.data) != len(batch_input):
+            raise ValueError("Embedding response does not match the number of inputs.")
+
+        # The API returns one item per input, tagged with its position in the request
+        for item in response.data:
+            if len(item.embedding) != expected_dimension:
+                raise ValueError(f"Embedding dimension {len(item.embedding)} does not match the expected dimension {expected_dimension}.")
+            fresh[batch_input[item.index]] = item.embedding
+        if on_progress is not None:
+            on_progress(sum(1 for text in cleaned if text in cached or text in fresh), len(cleaned))
+
+    if embedding_cache is not None:
+        embedding_cache.set_many(EMBEDDING_MODEL, fresh)
+    return [cached[text] if text in cached else fresh[text] for text in cleaned]
+
+def upsert_vectors(vectors: list, batch_size: int = PINECONE_UPSERT_BATCH_SIZE) -> dict:
+    """
+    Upserts `(id, values, metadata)` tuples into Pinecone in batches of
+    `batch_size`, retrying each batch independently. A batch that keeps
+    failing does not abort the rest; its vector IDs are reported back.
+    Returns {"upserted": <count>, "failed_ids": [...]}.
+    """
+    upserted = 0
+    failed_ids = []
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        try:
+            _call_with_retries(
+                lambda: get_pinecone_index().upsert(vectors=batch),
+                f"Pinecone upsert of {len(batch)} vectors",
+            )
+            upserted += len(batch)
+        except Exception as e:
+            batch_ids = [vector[0] for vector in batch]
+            logger.error(f"Error in upserting batch to Pinecone ({len(batch)} vectors): {str(e)}")
+            failed_ids.extend(batch_ids)
+    return {"upserted": upserted, "failed_ids": failed_ids}
+
+def release_and_link_waiters(blogs_collection, video_id: str, task_id: str, user_id: str,
+                             artifacts: dict = None):
+    """
+    Releases this task's in-flight claim on `video_id` and, if `artifacts` are
+    given, links a blog for every user that attached to the task while it ran.
+    Errors are logged rather than raised so they never fail the task itself.
+    """
+    try:
+        waiters = release_video(video_id, task_id)
+        if not artifacts:
+            return
+        for waiter_id, waiter_url in waiters.items():
+            if waiter_id == user_id or blogs_collection.find_one({"user_id": waiter_id, "video_id": video_id}):
+                continue
+            blog_id = link_blog_to_artifacts(blogs_collection, waiter_id, waiter_url, artifacts)
+            logger.info(f"Linked waiting user_id={waiter_id} to blog_id={blog_id} for video_id={video_id}")
+    except Exception as e:
+        logger.error(f"Error releasing in-flight claim for video_id={video_id}: {str(e)}", exc_info=True)
+
+
+class _TransientErrors:
     """
-    This Celery task runs the YTSummaryCrew to process the requested video
-    and then stores the result in MongoDB. Returns the created blog _id as a string.
+    The errors worth retrying a single stage for; anything else fails the
+    pipeline. Celery only turns `autoretry_for` into a tuple when it builds
+    the tasks (on first use, not at import), so the openai SDK is imported
+    then rather than on every API process's cold start.
     """
+
+    def __iter__(self):
+        from openai import APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+        return iter((
+            ConnectionError, TimeoutError, requests.RequestException, PyMongoError,
+            redis.ConnectionError, redis.TimeoutError,
+            APIConnectionError, APITimeoutError, RateLimitError, InternalServerError,
+        ))
+
+
+TRANSIENT_ERRORS = _TransientErrors()
+STAGE_MAX_RETRIES = int(os.getenv("STAGE_MAX_RETRIES", "3"))
+STAGE_OPTIONS = {
+    "autoretry_for": TRANSIENT_ERRORS,
+    "retry_backoff": True,
+    "retry_kwargs": {"max_retries": STAGE_MAX_RETRIES},
+}
+
+
+@celery_app.task(bind=True)
+def process_video_task(self, user_id: str, youtube_url: str) -> str:
+    """
+    Entry point for processing a video for a user. Returns the created blog
+    _id as a string.
+    If the video has already been processed (for any user), the blog is linked
+    to the shared per-video artifacts right away. Otherwise this task replaces
+    itself with the stage graph
+
+        transcript_stage -> {summary_stage, chunk_embed_stage, metadata_stage} -> finalize_stage
+
+    whose final stage inherits this task's ID, so callers polling it get the
+    blog_id when the graph completes. Stages publish progress events under
+    this task's ID (see agent.progress). The middle stages run in parallel on
+    any worker and each retries on its own after a transient error. The
+    transcript segments and the chunks travel between stages through
+    agent.stage_data rather than the result backend. Users
+    whose requests were coalesced onto this task get their blogs linked when
+    it finishes.
+    """
+    video_id = None
+    blogs_collection = None
     try:
         logger.info(f"Starting process_video_task for user_id={user_id}, url={youtube_url}")
 
-        # 1. Run the Crew to get transcript and summary
-        summary_crew = YTSummaryCrew(youtube_url)
-        result = summary_crew.run()
-        transcript = str(result['transcript'])
-        comprehensive_summary = str(result['summary'])
-        # qna_summary = str(result['qna_summary'])
-
-        transcript_json_str = json.dumps(transcript)
-        comprehensive_summary_json_str = json.dumps(comprehensive_summary)
-        # qna_summary_json_str = json.dumps(qna_summary)
-
-        # Convert the summary result to JSON string for safer storage
-        # result_json_str = json.dumps(result, default=str)
-        # print("result",result_json_str)
-        
-        # 2. Get YouTube title + thumbnail
-        video_id = youtube_url.split("v=")[1]
-        thumbnail_url = f"http://img.youtube.com/vi/{video_id}/0.jpg"
-        
-        # get yt video title
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            title_tag = soup.find("meta", {"name": "title"})
-            if title_tag and title_tag.get("content"):
-                video_title = title_tag["content"]
-                print("Video Title:", video_title)
-            else:
-                video_title = "Title not found."
-                print("Title not found.")
-        else:
-            video_title = "Title not found."
-            print("Failed to retrieve the video page.")
-        
-        #  3. Chunk the transcript to avoid huge inputs for embedding
-        transcript_chunks = chunk_text_by_words(transcript, chunk_size=500)
-
-        # 4. Insert everything into MongoDB
-        blogs_collection = get_blogs_collection()
-        blog_post = {
-            "user_id": user_id,
-            "video_title": video_title,
-            "youtube_url": youtube_url,
-            "transcript": transcript_json_str,
-            "comprehensive_summary": comprehensive_summary_json_str,
-            # "qna_summary": qna_summary_json_str,
-            "thumbnail": thumbnail_url,
-        }
-        inserted = blogs_collection.insert_one(blog_post)
-        blog_id = str(inserted.inserted_id)
-        
-        # 5. Embed and upsert the comprehensive summary into Pinecone
-        if not comprehensive_summary or not comprehensive_summary.strip():
-            raise ValueError("Comprehensive summary is empty. Cannot generate embedding.")
-        
-        summary_embedding_vector = get_embedding(comprehensive_summary)
-        try:
-            pinecone_index.upsert(vectors=[
-                (
-                    blog_id, # Use the blog_id as the Pinecone ID
-                    summary_embedding_vector,
-                    {
-                        "user_id": user_id,
-                        "youtube_url": youtube_url,
-                        "video_title": video_title,
-                        "type": "summary",
-                        "summary_text": comprehensive_summary
-                    }
-                )
-            ])
-        except Exception as e:
-            logger.error(f"Error in upserting to Pinecone: {str(e)}")
-
-        
-        # 6. Embed each transcript chunk separately and upsert into Pinecone
-        for idx, chunk in enumerate(transcript_chunks):
-            try:
-                embedding_vector = get_embedding(chunk)
-                vector_id = f"{blog_id}_{idx}"  # unique ID per chunk
-                pinecone_index.upsert(vectors=[
-                    (
-                        vector_id,
-                        embedding_vector,
-                        {
-                            "user_id": user_id,
-                            "youtube_url": youtube_url,
-                            "video_title": video_title,
-                            "type": "transcript_chunk",
-                            "chunk_index": idx,
-                            "chunk_text": chunk
-                        }
-                    )
-                ])
-            except Exception as e:
-                logger.error(f"Error embedding chunk #{idx} for blog_id={blog_id}: {str(e)}")
-
-        logger.info(f"Task complete for blog_id={blog_id}")
-        return blog_id
+        video = VideoRef.parse(youtube_url)
+        if not video:
+            raise ValueError(f"Could not extract a video ID from {youtube_url}")
+        video_id = video.video_id
+
+        db = get_db()
+        blogs_collection = db["blogs"]
+        videos_collection = db["videos"]
+
+        # Reuse the shared artifacts if another request already processed this video
+        artifacts = find_video_artifacts(videos_collection, video_id)
+        if artifacts:
+            # Store and key everything on the canonical URL, whatever form was submitted
+            blog_id = link_blog_to_artifacts(blogs_collection, user_id, video.url, artifacts)
+            logger.info(f"Linked blog_id={blog_id} to existing artifacts for video_id={video_id}")
+            release_and_link_waiters(blogs_collection, video_id, self.request.id, user_id, artifacts)
+            publish_progress(self.request.id, "completed", blog_id=blog_id)
+            return blog_id
 
     except Exception as e:
         # Celery will store the exception's string in the task result if it fails
         logger.error(f"Error in process_video_task: {str(e)}", exc_info=True)
+        if video_id:
+            release_and_link_waiters(blogs_collection, video_id, self.request.id, user_id)
+        publish_progress(self.request.id, "failed", error=str(e))
 
         return f"Error in process_video_task: {str(e)}"
+
+    task_id = self.request.id
+    # Stages stay on the queue this task came from, so bulk work never lands on interactive workers
+    queue = (self.request.delivery_info or {}).get("routing_key")
+    options = {"queue": queue} if queue else {}
+    pipeline = chain(
+        transcript_stage.s(video_id, task_id).set(**options),
+        chord(
+            [
+                summary_stage.s(video_id, task_id).set(**options),
+                chunk_embed_stage.s(video_id, task_id).set(**options),
+                metadata_stage.si(video_id, task_id).set(**options),
+            ],
+            finalize_stage.s(user_id, video_id, task_id).set(**options),
+        ),
+    )
+    pipeline.link_error(pipeline_failed.s(video_id=video_id, task_id=task_id))
+    logger.info(f"Dispatching stage graph for video_id={video_id}")
+    return self.replace(pipeline)
+
+
+@celery_app.task(**STAGE_OPTIONS)
+def transcript_stage(video_id: str, task_id: str) -> dict:
+    """
+    Fetches the timestamped transcript and saves its segments as stage data.
+    Returns {"segments": <count>}.
+    """
+    # crewai (behind the tool and the crew) is slow to import, so only the
+    # stages that use it pay for it
+    from agent.tools import YouTubeTranscriptTool
+    refresh_claim(video_id, task_id)
+    with span("transcript_fetch", video_id=video_id, task_id=task_id):
+        segments = YouTubeTranscriptTool().get_transcript_segments(video_id)
+    if not segments:
+        raise ValueError(f"No suitable transcript found for video_id={video_id}")
+    save_stage_data(task_id, "segments", segments)
+    publish_progress(task_id, "transcript_fetched", segments=len(segments))
+    return {"segments": len(segments)}
+
+
+def load_transcript(task_id: str) -> tuple:
+    """Returns the (transcript, segments) saved by `transcript_stage`."""
+    segments = load_stage_data(task_id, "segments")
+    return " ".join(segment["text"] for segment in segments), segments
+
+
+@celery_app.task(**STAGE_OPTIONS)
+def summary_stage(transcript_result: dict, video_id: str, task_id: str) -> dict:
+    """
+    Summarizes the transcript with the crew and upserts the summary vector.
+    Returns {"summary", "token_usage"}.
+    """
+    from crew import YTSummaryCrew
+    video = VideoRef(video_id)
+    transcript, _ = load_transcript(task_id)
+    # A long video's map-reduce summary can outlast the claim's TTL
+    with hold_claim(video_id, task_id), span("crew_summarize", video_id=video_id, task_id=task_id):
+        result = YTSummaryCrew(video.url).summarize(transcript)
+    comprehensive_summary = str(result["summary"])
+    # The crew has already added each of its runs to the token and cost counters
+    logger.info(f"Crew token usage for video_id={video_id}: {result.get('token_usage')}")
+    if not comprehensive_summary.strip():
+        raise ValueError("Comprehensive summary is empty. Cannot generate embedding.")
+
+    with span("embed", video_id=video_id, task_id=task_id, texts=1):
+        summary_embedding = get_embeddings([comprehensive_summary])[0]
+    # Vectors are keyed by video so every user of the video shares them; the
+    # summary text itself lives in the video's artifacts
+    vector = (
+        summary_vector_id(video_id),
+        summary_embedding,
+        {"video_id": video_id, "type": "summary"}
+    )
+    with span("upsert", video_id=video_id, task_id=task_id, vectors=1):
+        upsert_result = get_vector_store().upsert([vector])
+    if upsert_result["failed_ids"]:
+        logger.error(f"Failed to upsert the summary vector for video_id={video_id}")
+    publish_progress(task_id, "summarized")
+
+    return {
+        "summary": comprehensive_summary,
+        "token_usage": result.get("token_usage"),
+    }
+
+
+@celery_app.task(**STAGE_OPTIONS)
+def chunk_embed_stage(transcript_result: dict, video_id: str, task_id: str) -> dict:
+    """
+    Chunks the transcript into sentence-aligned chunks that keep their
+    timestamps, embeds them in batched requests and bulk upserts them.
+    The chunks are saved as stage data for `finalize_stage`. Returns
+    {"chunks": <count>}; failed upsert batches are reported but don't fail the stage.
+    """
+    _, segments = load_transcript(task_id)
+    chunks = chunk_segments(segments)
+    with hold_claim(video_id, task_id), span("embed", video_id=video_id, task_id=task_id, texts=len(chunks)):
+        embeddings = get_embeddings(
+            [chunk["text"] for chunk in chunks],
+            on_progress=lambda done, total: publish_progress(task_id, "chunks_embedded", done=done, total=total),
+        )
+
+    # Only IDs go into the metadata; retrieval rehydrates the chunk text and
+    # timestamps from the video's artifacts
+    vectors = [
+        (chunk_vector_id(video_id, idx), embedding_vector,
+         {"video_id": video_id, "type": "transcript_chunk", "chunk_index": idx})
+        for idx, embedding_vector in enumerate(embeddings)
+    ]
+
+    with span("upsert", video_id=video_id, task_id=task_id, vectors=len(vectors)):
+        upsert_result = get_vector_store().upsert(vectors)
+    if upsert_result["failed_ids"]:
+        logger.error(
+            f"Failed to upsert {len(upsert_result['failed_ids'])}/{len(vectors)} vectors "
+            f"for video_id={video_id}: {upsert_result['failed_ids']}"
+        )
+    save_stage_data(task_id, "chunks", chunks)
+    return {"chunks": len(chunks)}
+
+
+@celery_app.task(**STAGE_OPTIONS)
+def metadata_stage(video_id: str, task_id: str) -> dict:
+    """Fetches the title, thumbnail and duration. Returns {"title", "thumbnail", "duration"}."""
+    refresh_claim(video_id, task_id)
+    with span("metadata_fetch", video_id=video_id, task_id=task_id):
+        metadata = fetch_video_metadata(VideoRef(video_id))
+    publish_progress(task_id, "metadata_fetched", title=metadata["title"])
+    return metadata
+
+
+@celery_app.task(**STAGE_OPTIONS)
+def finalize_stage(stage_results: list, user_id: str, video_id: str, task_id: str) -> str:
+    """
+    Stores the shared artifacts, links this user's blog to them and hands the
+    result to every request that attached to the task. `stage_results` are
+    the summary, chunk and metadata stage results in that order. Returns the
+    blog _id as a string.
+    """
+    summary_result, _, video_metadata = stage_results
+    refresh_claim(video_id, task_id)
+    transcript, _ = load_transcript(task_id)
+    video = VideoRef(video_id)
+    db = get_db()
+    blogs_collection = db["blogs"]
+
+    with span("save_artifacts", video_id=video_id, task_id=task_id):
+        artifacts = save_video_artifacts(
+            db["videos"],
+            video_id=video_id,
+            youtube_url=video.url,
+            video_title=video_metadata["title"],
+            thumbnail_url=video_metadata["thumbnail"],
+            duration=video_metadata["duration"],
+            transcript=transcript,
+            comprehensive_summary=summary_result["summary"],
+            chunks=load_stage_data(task_id, "chunks"),
+        )
+        blog_id = link_blog_to_artifacts(blogs_collection, user_id, video.url, artifacts)
+    # Answers cached for a previous version of these artifacts are stale now
+    invalidate_video(video_id)
+
+    release_and_link_waiters(blogs_collection, video_id, task_id, user_id, artifacts)
+    publish_progress(task_id, "completed", blog_id=blog_id)
+    # Last, so a retry of this stage can still load them
+    clear_stage_data(task_id)
+
+    logger.info(f"Task complete for blog_id={blog_id}")
+    return blog_id
+
+
+@celery_app.task
+def pipeline_failed(request, exc, traceback, video_id: str, task_id: str):
+    """Error callback for the stage graph: releases the in-flight claim so the video can be retried."""
+    logger.error(f"Stage {request.task} failed for video_id={video_id}: {str(exc)}")
+    release_and_link_waiters(get_blogs_collection(), video_id, task_id, None)
+    publish_progress(task_id, "failed", error=str(exc))
+    try:
+        clear_stage_data(task_id)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to clear stage data for task {task_id}: {str(e)}")
+
+
+def task_finished(task_id: str) -> bool:
+    """Whether the task (or the stage graph that replaced it) has finished."""
+    return AsyncResult(task_id, app=celery_app).ready()
+
+
+def schedule_batch(batch_id: str) -> int:
+    """
+    Starts queued videos of a batch on the bulk queue while it has free
+    concurrency slots. Videos another request is already processing are
+    attached to that task as waiters (like /process-video does) and give
+    their slot back. Returns the number of tasks started.
+    """
+    meta, _ = get_batch(batch_id)
+    if not meta:
+        return 0
+    user_id, max_concurrency = meta["user_id"], int(meta["max_concurrency"])
+
+    started = 0
+    while True:
+        next_item = take_next_item(batch_id, max_concurrency)
+        if next_item is None:
+            return started
+        video_id, item = next_item
+        task_id = str(uuid.uuid4())
+        try:
+            owner_task_id = claim_or_take_over(video_id, task_id, task_finished)
+            if owner_task_id:
+                add_waiter(video_id, user_id, item["youtube_url"])
+                update_item(batch_id, video_id, status="coalesced", task_id=owner_task_id)
+                release_slot(batch_id)
+                continue
+            update_item(batch_id, video_id, status="processing", task_id=task_id)
+            process_video_task.apply_async(
+                (user_id, item["youtube_url"]),
+                task_id=task_id,
+                queue=BULK_QUEUE,
+                link=batch_item_done.s(batch_id, video_id).set(queue=BULK_QUEUE),
+                link_error=batch_item_failed.s(batch_id=batch_id, video_id=video_id),
+            )
+            started += 1
+        except Exception as e:
+            logger.error(f"Error scheduling video_id={video_id} for batch_id={batch_id}: {str(e)}", exc_info=True)
+            release_video(video_id, task_id)
+            update_item(batch_id, video_id, status="processing")
+            finish_item(batch_id, video_id, "failed", error=str(e))
+
+
+@celery_app.task
+def batch_item_done(result: str, batch_id: str, video_id: str):
+    """Callback of a batch video's task: records the blog (or the error string) and schedules the next video."""
+    if isinstance(result, str) and result.startswith("Error"):
+        finish_item(batch_id, video_id, "failed", error=result)
+    else:
+        finish_item(batch_id, video_id, "completed", blog_id=result)
+    schedule_batch(batch_id)
+
+
+@celery_app.task
+def batch_item_failed(request, exc, traceback, batch_id: str, video_id: str):
+    """Error callback of a batch video's task graph."""
+    if finish_item(batch_id, video_id, "failed", error=str(exc)):
+        schedule_batch(batch_id)
@@ -2,7 +2,7 @@
 from crewai.tools import BaseTool
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import NoTranscriptFound
-from urllib.parse import urlparse, parse_qs
+from agent.video import extract_video_id
 
 class YouTubeTranscriptTool(BaseTool):
     name: str = "YouTube Transcript Extractor"
@@ -16,36 +16,32 @@ class YouTubeTranscriptTool(BaseTool):
             return f"Error: {str(e)}"
 
     def get_best_transcript(self, video_id: str) -> str:
+        try:
+            return " ".join([entry['text'] for entry in self.get_transcript_segments(video_id)])
+        except Exception as e:
+            return f"Error: No suitable transcript found. {str(e)}"
+
+    def get_transcript_segments(self, video_id: str) -> list:
+        """
+        Returns the raw transcript segments ({"text", "start", "duration"}),
+        preferring English, then Hindi, then any manual transcript translated
+        to English. Raises if no transcript is available.
+        """
         try:
             # Try English first
-            transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=['en'])
-            return " ".join([entry['text'] for entry in transcript])
+            return YouTubeTranscriptApi.get_transcript(video_id, languages=['en'])
         except NoTranscriptFound:
+            # Get available transcripts
+            transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+            
+            # Try Hindi
             try:
-                # Get available transcripts
-                transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-                
-                # Try Hindi
-                try:
-                    transcript = transcript_list.find_transcript(['hi'])
-                    return " ".join([entry['text'] for entry in transcript.fetch()])
-                except:
-                    # Get any available and translate to English
-                    transcript = transcript_list.find_manually_created_transcript()
-                    translated = transcript.translate('en').fetch()
-                    return " ".join([entry['text'] for entry in translated])
-            except Exception as e:
-                return f"Error: No suitable transcript found. {str(e)}"
+                transcript = transcript_list.find_transcript(['hi'])
+                return transcript.fetch()
+            except:
+                # Get any available and translate to English
+                transcript = transcript_list.find_manually_created_transcript()
+                return transcript.translate('en').fetch()
 
     def extract_video_id(self, url: str):
-        query = urlparse(url)
-        if query.hostname == 'youtu.be':
-            return query.path[1:]
-        if query.hostname in ('www.youtube.com', 'youtube.com'):
-            if query.path == '/watch':
-                return parse_qs(query.query)['v'][0]
-            if query.path.startswith('/embed/'):
-                return query.path.split('/')[2]
-            if query.path.startswith('/v/'):
-                return query.path.split('/')[2]
-        return None
\ No newline at end of file
+        return extract_video_id(url)
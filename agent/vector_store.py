@@ -0,0 +1,228 @@
+# vector_store.py
+"""
+Vector storage backends for summary and transcript-chunk embeddings.
+
+VECTOR_BACKEND selects where vectors live:
+  - "pinecone" (default): the shared Pinecone index.
+  - "local": one float32 matrix per video on disk, memory-mapped and searched
+    with brute-force cosine similarity in-process. A video only has a few
+    dozen chunks, so this is faster than a network round trip and needs no
+    external service. VECTOR_STORE_DIR must be shared by the API and workers.
+
+Both backends take Pinecone-style `(id, values, metadata)` tuples and return
+Pinecone-style matches ({"id", "score", "metadata"}).
+"""
+import os
+import json
+import fcntl
+import logging
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "./vector_store")
+PINECONE_CLOUD = os.getenv("PINECONE_CLOUD", "aws")
+PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
+EMBEDDING_DIMENSION = 1536  # text-embedding-ada-002
+
+
+class PineconeVectorStore:
+    def upsert(self, vectors: list) -> dict:
+        # Imported lazily: agent.tasks owns the batched upsert and imports this module
+        from agent.tasks import upsert_vectors
+        return upsert_vectors(vectors)
+
+    def query(self, vector: list, top_k: int, filter: dict) -> list:
+        from agent.clients import get_pinecone_index
+        response = get_pinecone_index().query(
+            vector=vector,
+            top_k=top_k,
+            filter=filter,
+            include_metadata=True
+        )
+        return response.get("matches", [])
+
+
+class LocalVectorStore:
+    """
+    Stores each video's vectors as a matrix file of L2-normalized float32
+    rows plus `<video_id>.json`, which names the current matrix file and
+    holds the ids + metadata in row order. Matrix files are never modified:
+    an upsert writes a new one and then atomically replaces the JSON, so a
+    reader always sees a matching matrix and metadata. Upserts of the same
+    video (e.g. the summary and chunk stages in different worker processes)
+    are serialized with a per-video file lock.
+    """
+
+    def __init__(self, directory: str = VECTOR_STORE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _meta_path(self, video_id: str) -> str:
+        return os.path.join(self.directory, f"{video_id}.json")
+
+    @contextmanager
+    def _video_lock(self, video_id: str):
+        with open(os.path.join(self.directory, f"{video_id}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self, video_id: str):
+        """Returns (matrix file name, entries), or (None, []) if the video has no vectors."""
+        try:
+            with open(self._meta_path(video_id)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None, []
+        if isinstance(meta, list):
+            # Written before the metadata named its matrix file
+            return f"{video_id}.npy", meta
+        return meta["matrix"], meta["entries"]
+
+    def _load(self, video_id: str, mmap: bool = True):
+        for _ in range(3):
+            matrix_name, entries = self._read_meta(video_id)
+            if matrix_name is None:
+                return None, []
+            try:
+                matrix = np.load(os.path.join(self.directory, matrix_name), mmap_mode="r" if mmap else None)
+            except FileNotFoundError:
+                # An upsert replaced the matrix between the two reads; read the new pair
+                continue
+            return matrix, entries
+        raise RuntimeError(f"Local vector store for video_id={video_id} kept changing while being read")
+
+    def _write_video(self, video_id: str, matrix, entries: list) -> str:
+        """Writes a new matrix file, then points the metadata at it. Returns the matrix file name."""
+        fd, matrix_path = tempfile.mkstemp(dir=self.directory, prefix=f"{video_id}.", suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        os.chmod(matrix_path, 0o644)
+
+        matrix_name = os.path.basename(matrix_path)
+        fd, meta_tmp = tempfile.mkstemp(dir=self.directory, prefix=f"{video_id}.", suffix=".json.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"matrix": matrix_name, "entries": entries}, f)
+        os.chmod(meta_tmp, 0o644)
+        os.replace(meta_tmp, self._meta_path(video_id))
+        return matrix_name
+
+    def upsert(self, vectors: list) -> dict:
+        """
+        Merges vectors into their video's files (grouped by metadata["video_id"]).
+        """
+        by_video = {}
+        failed_ids = []
+        for vector_id, values, metadata in vectors:
+            video_id = metadata.get("video_id")
+            if not video_id:
+                failed_ids.append(vector_id)
+                continue
+            by_video.setdefault(video_id, []).append((vector_id, values, metadata))
+        if failed_ids:
+            logger.error(f"Local vector store needs a video_id in metadata; skipped {failed_ids}")
+
+        upserted = 0
+        for video_id, items in by_video.items():
+            with self._video_lock(video_id):
+                previous_name, _ = self._read_meta(video_id)
+                matrix, entries = self._load(video_id, mmap=False)
+                rows = {entry["id"]: (matrix[i], entry["metadata"]) for i, entry in enumerate(entries)}
+                for vector_id, values, metadata in items:
+                    row = np.asarray(values, dtype=np.float32)
+                    norm = np.linalg.norm(row)
+                    rows[vector_id] = (row / norm if norm else row, metadata)
+
+                ids = list(rows)
+                new_matrix = np.stack([rows[i][0] for i in ids]).astype(np.float32)
+                new_entries = [{"id": i, "metadata": rows[i][1]} for i in ids]
+                self._write_video(video_id, new_matrix, new_entries)
+                if previous_name:
+                    # Readers that already mapped the old file keep their view of it
+                    try:
+                        os.remove(os.path.join(self.directory, previous_name))
+                    except FileNotFoundError:
+                        pass
+            upserted += len(items)
+        return {"upserted": upserted, "failed_ids": failed_ids}
+
+    def query(self, vector: list, top_k: int, filter: dict) -> list:
+        """
+        Cosine top-k over the video's vectors. The filter must include a
+        video_id; any other keys are matched exactly against metadata.
+        """
+        video_id = filter.get("video_id")
+        if not video_id:
+            logger.warning(f"Local vector store query without video_id is not supported: {filter}")
+            return []
+        matrix, entries = self._load(video_id)
+        if matrix is None:
+            return []
+
+        other = {k: v for k, v in filter.items() if k != "video_id"}
+        candidates = np.array([
+            i for i, entry in enumerate(entries)
+            if all(entry["metadata"].get(k) == v for k, v in other.items())
+        ], dtype=np.int64)
+        if candidates.size == 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = matrix[candidates] @ query
+
+        k = min(top_k, candidates.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": entries[candidates[i]]["id"], "score": float(scores[i]), "metadata": entries[candidates[i]]["metadata"]}
+            for i in top
+        ]
+
+
+_vector_store = None
+
+
+def get_vector_store():
+    """Returns the process-wide vector store for VECTOR_BACKEND."""
+    global _vector_store
+    if _vector_store is None:
+        if VECTOR_BACKEND == "local":
+            _vector_store = LocalVectorStore()
+        elif VECTOR_BACKEND == "pinecone":
+            _vector_store = PineconeVectorStore()
+        else:
+            raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+    return _vector_store
+
+
+def ensure_vector_index():
+    """
+    Creates the Pinecone index if it doesn't exist yet (a no-op for the
+    local backend). Provisioning is an explicit step - run at API startup
+    and by `python -m schema --ensure` - rather than an import side effect.
+    """
+    if VECTOR_BACKEND != "pinecone":
+        return
+    from pinecone import ServerlessSpec
+    from agent.clients import PINECONE_INDEX_NAME, get_pinecone_client
+
+    pc = get_pinecone_client()
+    if PINECONE_INDEX_NAME in pc.list_indexes().names():
+        return
+    logger.info(f"Creating Pinecone index {PINECONE_INDEX_NAME}")
+    pc.create_index(
+        name=PINECONE_INDEX_NAME,
+        dimension=EMBEDDING_DIMENSION,
+        metric="cosine",
+        spec=ServerlessSpec(cloud=PINECONE_CLOUD, region=PINECONE_REGION),
+    )
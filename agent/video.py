@@ -0,0 +1,105 @@
+# video.py
+"""
+Canonical identity of a YouTube video.
+
+Every URL form of a video (watch?v=, youtu.be, embed, shorts, with or without
+extra query parameters such as &t=30) parses to the same `VideoRef`, and
+everything that keys on a video - the in-flight registry, the "videos"
+collection, blog documents, vector IDs and vector-store filters - uses its
+`video_id`. Stored URLs are always the canonical `VideoRef.url`.
+"""
+import re
+from dataclasses import dataclass
+from urllib.parse import urlparse, parse_qs
+
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+PLAYLIST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{10,}$")
+
+YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com"}
+
+# Path prefixes whose next segment is the video ID
+ID_PATH_PREFIXES = ("embed", "v", "shorts", "live")
+
+
+@dataclass(frozen=True)
+class VideoRef:
+    video_id: str
+
+    @property
+    def url(self) -> str:
+        """The canonical watch URL, used wherever a URL is stored."""
+        return f"https://www.youtube.com/watch?v={self.video_id}"
+
+    @property
+    def thumbnail_url(self) -> str:
+        return f"http://img.youtube.com/vi/{self.video_id}/0.jpg"
+
+    def at(self, seconds: float) -> str:
+        """Watch URL that starts playback at `seconds`."""
+        return f"{self.url}&t={int(seconds)}s"
+
+    @classmethod
+    def parse(cls, url: str):
+        """
+        Returns the VideoRef for any YouTube URL form (or a bare video ID),
+        or None if `url` does not identify a video.
+        """
+        video_id = _parse_video_id(url)
+        return cls(video_id) if video_id else None
+
+
+def _parse_video_id(url: str):
+    if not url:
+        return None
+    url = url.strip()
+    if VIDEO_ID_PATTERN.match(url):
+        return url
+    if "://" not in url:
+        url = "https://" + url
+
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    segments = [segment for segment in parsed.path.split("/") if segment]
+
+    candidate = None
+    if host == "youtu.be" and segments:
+        candidate = segments[0]
+    elif host in YOUTUBE_HOSTS:
+        if segments == ["watch"]:
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(segments) >= 2 and segments[0] in ID_PATH_PREFIXES:
+            candidate = segments[1]
+
+    if candidate and VIDEO_ID_PATTERN.match(candidate):
+        return candidate
+    return None
+
+
+def extract_video_id(url: str):
+    """
+    Returns the YouTube video ID for any supported URL form, or None if the
+    URL is not recognised.
+    """
+    ref = VideoRef.parse(url)
+    return ref.video_id if ref else None
+
+
+def parse_playlist_id(url: str):
+    """Returns the playlist ID of a YouTube playlist (or watch-in-playlist) URL, or None."""
+    if not url:
+        return None
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host not in YOUTUBE_HOSTS and host != "youtu.be":
+        return None
+    playlist_id = parse_qs(parsed.query).get("list", [None])[0]
+    if playlist_id and PLAYLIST_ID_PATTERN.match(playlist_id):
+        return playlist_id
+    return None
@@ -0,0 +1,114 @@
+# bench_api_load.py
+"""
+Concurrent load test of the /ask endpoint against the local fakes.
+
+Fires `--requests` /ask calls with `--concurrency` in flight at a time
+through the ASGI app in-process and reports throughput and latency
+percentiles. With a non-blocking data layer, throughput should grow with
+concurrency instead of staying at 1 / (per-request latency).
+
+    python -m benchmarks.bench_api_load --requests 200 --concurrency 1,10,50
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fakes import install_fakes, fake_embedding, FakePinecone
+
+USER_ID = "bench-user"
+VIDEO_ID = "benchvideo1"
+VIDEO_TITLE = "Benchmark video"
+
+
+async def seed(datastore):
+    from agent.artifacts import compress_text, chunk_offsets
+    from agent.bm25 import build_bm25_index
+
+    await datastore.blogs_collection.insert_one({
+        "user_id": USER_ID,
+        "video_id": VIDEO_ID,
+        "video_title": VIDEO_TITLE,
+        "youtube_url": f"https://www.youtube.com/watch?v={VIDEO_ID}",
+    })
+    chunk_texts = [f"chunk {idx} of the benchmark transcript." for idx in range(40)]
+    transcript = " ".join(chunk_texts)
+    await datastore.videos_collection.insert_one({
+        "_id": VIDEO_ID,
+        "video_id": VIDEO_ID,
+        "video_title": VIDEO_TITLE,
+        "transcript_compressed": compress_text(transcript),
+        "comprehensive_summary": "A summary of the benchmark video.",
+        "chunk_count": len(chunk_texts),
+        "chunk_offsets": chunk_offsets(transcript, chunk_texts),
+        "chunk_times": [[idx * 30.0, (idx + 1) * 30.0] for idx in range(len(chunk_texts))],
+        "bm25_index": build_bm25_index(chunk_texts),
+    })
+    for idx, text in enumerate(chunk_texts):
+        FakePinecone.index.vectors[f"{VIDEO_ID}_{idx}"] = (fake_embedding(text), {
+            "video_id": VIDEO_ID, "type": "transcript_chunk", "chunk_index": idx,
+        })
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_load(client, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/ask", json={
+                "user_id": USER_ID, "video_title": VIDEO_TITLE, "query": f"question {i % 10}",
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests_per_second": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def main_async(args):
+    import httpx
+    import datastore
+    from main import app
+
+    await seed(datastore)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for concurrency in args.concurrency:
+            result = await run_load(client, args.requests, concurrency)
+            print(f"concurrency={result['concurrency']:>4}  {result['requests_per_second']:8.1f} req/s  "
+                  f"p50={result['p50_ms']:.0f}ms  p99={result['p99_ms']:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 10, 50])
+    parser.add_argument("--openai-latency", type=float, default=0.1)
+    parser.add_argument("--pinecone-latency", type=float, default=0.03)
+    args = parser.parse_args()
+
+    # Keep the run self-contained: every Redis-backed feature on the /ask path
+    # is off (the answer cache would also turn repeated questions into hits)
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    install_fakes(args.openai_latency, args.pinecone_latency)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# bench_crew_modes.py
+"""
+Compares end-to-end latency and LLM token use of fetching the transcript
+directly and summarizing it ("direct", what ingest does) against the
+original researcher-agent crew ("agent") on a real video. Needs
+OPENAI_API_KEY and network access, since token counts only mean something
+against the real model.
+
+    python -m benchmarks.bench_crew_modes https://www.youtube.com/watch?v=IVbm2a6lVBo --runs 2
+"""
+import argparse
+import json
+import time
+
+from crew import YTSummaryCrew
+
+
+def run_direct(youtube_url: str, summary_mode: str = None) -> dict:
+    crew = YTSummaryCrew(youtube_url)
+    transcript = " ".join(segment["text"] for segment in crew.fetch_segments())
+    return crew.summarize(transcript, summary_mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("youtube_url")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--summary-mode", default=None, help="single, map_reduce or auto (direct mode only)")
+    args = parser.parse_args()
+
+    report = {}
+    for mode in ("direct", "agent"):
+        timings, tokens = [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            if mode == "direct":
+                result = run_direct(args.youtube_url, args.summary_mode)
+            else:
+                result = YTSummaryCrew(args.youtube_url).summarize_with_researcher()
+            timings.append(time.perf_counter() - start)
+            tokens.append(result["token_usage"]["total_tokens"])
+        report[mode] = {
+            "mean_seconds": sum(timings) / len(timings),
+            "mean_total_tokens": sum(tokens) / len(tokens),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench_import_time.py
+"""
+Measures how long a fresh interpreter takes to `import main` (the API's
+cold start before uvicorn can serve) and fails if the median exceeds the
+budget. Each run is a new subprocess with the OpenAI/Pinecone keys unset
+and the service URLs pointed at unreachable addresses, so an import that
+touches the network or needs credentials fails the benchmark instead of
+passing slowly.
+
+    python -m benchmarks.bench_import_time --runs 5 --budget 3.0 [--module agent.tasks] [--top 10]
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)")
+
+# Nothing should listen here; any connection attempt fails fast
+UNREACHABLE_URL = "redis://127.0.0.1:1/0"
+
+
+def offline_env() -> dict:
+    env = {k: v for k, v in os.environ.items() if k not in ("OPENAI_API_KEY", "PINECONE_API_KEY")}
+    env.update({
+        "MONGO_URI": "mongodb://127.0.0.1:1/",
+        "CELERY_BROKER_URL": UNREACHABLE_URL,
+        "CELERY_RESULT_BACKEND": UNREACHABLE_URL,
+    })
+    return env
+
+
+def time_import(module: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], env=offline_env(),
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_top_level_imports(module: str, top: int) -> list:
+    """Top-level packages by cumulative import time, from `python -X importtime`."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            env=offline_env(), capture_output=True, text=True, timeout=120)
+    totals = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        # Only modules imported directly by `module` itself (one level of indentation)
+        if match and len(match.group(2)) == 3:
+            totals[match.group(3)] = int(match.group(1)) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=3.0, help="max median seconds")
+    parser.add_argument("--top", type=int, default=10, help="also list the N slowest direct imports")
+    args = parser.parse_args()
+
+    timings = [time_import(args.module) for _ in range(args.runs)]
+    median = statistics.median(timings)
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "median_seconds": round(median, 3),
+        "max_seconds": round(max(timings), 3),
+        "budget_seconds": args.budget,
+        "within_budget": median <= args.budget,
+    }
+    if args.top:
+        report["slowest_imports"] = {name: round(seconds, 3)
+                                     for name, seconds in slowest_top_level_imports(args.module, args.top)}
+    print(json.dumps(report, indent=2))
+    if median > args.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# bench_ingest.py
+"""
+Compares the per-chunk embed/upsert loop against the batched path used by
+`process_video_task`, using the local fakes (no network access needed).
+
+    python -m benchmarks.bench_ingest --minutes 100 --openai-latency 0.2
+"""
+import argparse
+import os
+import time
+
+from benchmarks.fakes import install_fakes, reset_stats, fake_transcript_segments, FakeOpenAI, FakeIndex
+
+
+def run_serial(tasks, chunks):
+    for idx, chunk in enumerate(chunks):
+        vector = tasks.get_embedding(chunk)
+        tasks.get_pinecone_index().upsert(vectors=[(f"serial_{idx}", vector, {"chunk_index": idx})])
+
+
+def run_batched(tasks, chunks):
+    vectors = tasks.get_embeddings(chunks)
+    tasks.upsert_vectors([
+        (f"batched_{idx}", vector, {"chunk_index": idx})
+        for idx, vector in enumerate(vectors)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=int, default=100, help="transcript length (~18000 words)")
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    parser.add_argument("--pinecone-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Both loops embed the same chunks; the cache would turn the second into hits
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    install_fakes(args.openai_latency, args.pinecone_latency)
+    from agent import tasks
+
+    segments = fake_transcript_segments("bench-ingest", minutes=args.minutes)
+    chunks = [chunk["text"] for chunk in tasks.chunk_segments(segments)]
+    print(f"{len(chunks)} chunks")
+
+    for name, fn in (("serial", run_serial), ("batched", run_batched)):
+        reset_stats()
+        start = time.perf_counter()
+        fn(tasks, chunks)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8}: {elapsed:.2f}s  "
+              f"embedding_requests={FakeOpenAI.stats['embedding_requests']}  "
+              f"upsert_requests={FakeIndex.stats['upsert_requests']}")
+
+
+if __name__ == "__main__":
+    main()
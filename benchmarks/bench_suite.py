@@ -0,0 +1,209 @@
+# bench_suite.py
+"""
+Offline benchmark suite: ingest throughput, per-stage ingest latency and
+/ask latency under concurrency, entirely against the local fakes (no
+network, no credentials; see `benchmarks.fakes`).
+
+Ingest runs `--videos` fixture videos through the real stage tasks, with
+`--workers` videos in flight at a time. Each video runs like the Celery
+stage graph does across workers: the transcript stage, then the summary,
+chunk/embed and metadata stages in parallel, then finalize. The /ask phase
+reuses `bench_api_load` at each `--ask-concurrency` level.
+
+The result is one JSON document tagged with the git commit, printed and
+optionally written to `--output`. With `--baseline` (an earlier result) the
+key metrics are compared and the run exits non-zero if any regressed by
+more than `--max-regression`.
+
+    python -m benchmarks.bench_suite --videos 20 --workers 4 --output bench.json [--baseline old.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.fakes import install_fakes, install_pipeline_fakes, reset_stats, FakeOpenAI, FakeIndex
+
+USER_ID = "bench-user"
+HEADER_STAGES = ("summary", "chunk_embed", "metadata")
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(values: list) -> dict:
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p90_ms": round(percentile(values, 90) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ingest_video(tasks, video_id: str, timings: dict):
+    from agent.inflight import claim_video
+
+    task_id = uuid.uuid4().hex
+    # Like /process-video, the pipeline runs under the video's in-flight claim
+    claim_video(video_id, task_id)
+
+    def timed(name, stage, *args):
+        start = time.perf_counter()
+        # `run` is the task body (with its autoretry policy), without Celery's request context
+        result = stage.run(*args)
+        timings[name].append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    transcript_result = timed("transcript", tasks.transcript_stage, video_id, task_id)
+    # The chord header stages run on separate workers in production
+    with ThreadPoolExecutor(max_workers=len(HEADER_STAGES)) as pool:
+        header = [
+            pool.submit(timed, "summary", tasks.summary_stage, transcript_result, video_id, task_id),
+            pool.submit(timed, "chunk_embed", tasks.chunk_embed_stage, transcript_result, video_id, task_id),
+            pool.submit(timed, "metadata", tasks.metadata_stage, video_id, task_id),
+        ]
+        stage_results = [future.result() for future in header]
+    timed("finalize", tasks.finalize_stage, stage_results, USER_ID, video_id, task_id)
+    timings["total"].append(time.perf_counter() - start)
+
+
+def run_ingest(videos: int, workers: int) -> dict:
+    from agent import tasks
+
+    reset_stats()
+    timings = defaultdict(list)
+    video_ids = [f"bench{i:06d}" for i in range(videos)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda video_id: ingest_video(tasks, video_id, timings), video_ids))
+    elapsed = time.perf_counter() - start
+    return {
+        "videos": videos,
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "videos_per_minute": round(videos / elapsed * 60, 2),
+        "stages": {name: latency_summary(values) for name, values in timings.items()},
+        "requests_per_video": {
+            name: round(count / videos, 2)
+            for name, count in {**FakeOpenAI.stats, **FakeIndex.stats}.items()
+        },
+    }
+
+
+async def run_ask(requests: int, concurrency_levels: list) -> list:
+    import httpx
+    import datastore
+    from main import app
+    from benchmarks.bench_api_load import seed, run_load
+
+    await seed(datastore)
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for concurrency in concurrency_levels:
+            result = await run_load(client, requests, concurrency)
+            results.append({key: round(value, 2) if isinstance(value, float) else value
+                            for key, value in result.items()})
+    return results
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list:
+    """Returns a description of every key metric that regressed by more than `max_regression`."""
+    # (label, current, baseline, higher_is_better)
+    metrics = [("ingest videos_per_minute", result["ingest"]["videos_per_minute"],
+                baseline["ingest"]["videos_per_minute"], True)]
+    for stage, summary in result["ingest"]["stages"].items():
+        if stage in baseline["ingest"]["stages"]:
+            metrics.append((f"ingest {stage} p50_ms", summary["p50_ms"],
+                            baseline["ingest"]["stages"][stage]["p50_ms"], False))
+    baseline_ask = {level["concurrency"]: level for level in baseline["ask"]}
+    for level in result["ask"]:
+        previous = baseline_ask.get(level["concurrency"])
+        if previous:
+            metrics.append((f"ask c={level['concurrency']} p99_ms", level["p99_ms"], previous["p99_ms"], False))
+            metrics.append((f"ask c={level['concurrency']} requests_per_second",
+                            level["requests_per_second"], previous["requests_per_second"], True))
+
+    regressions = []
+    for label, current, previous, higher_is_better in metrics:
+        if not previous:
+            continue
+        change = (previous - current) / previous if higher_is_better else (current - previous) / previous
+        if change > max_regression:
+            regressions.append(f"{label}: {previous} -> {current} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4, help="videos ingested concurrently")
+    parser.add_argument("--transcript-minutes", type=int, default=10)
+    parser.add_argument("--ask-requests", type=int, default=200)
+    parser.add_argument("--ask-concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 10, 50])
+    parser.add_argument("--openai-latency", type=float, default=0.1)
+    parser.add_argument("--pinecone-latency", type=float, default=0.03)
+    parser.add_argument("--summarizer-latency", type=float, default=1.0)
+    parser.add_argument("--transcript-latency", type=float, default=0.3)
+    parser.add_argument("--watch-page-latency", type=float, default=0.2)
+    parser.add_argument("--mongo-uri", default=None, help="use this local Mongo instead of mongomock")
+    parser.add_argument("--output", default=None, help="also write the JSON result here")
+    parser.add_argument("--baseline", default=None, help="earlier result to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Caches would turn repeated fixture work into hits; measure the uncached path
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+    install_fakes(args.openai_latency, args.pinecone_latency)
+    install_pipeline_fakes(args.transcript_latency, args.summarizer_latency, args.watch_page_latency,
+                           args.transcript_minutes, args.mongo_uri)
+
+    # Keep stdout for the JSON result; anything the app prints goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        ingest = run_ingest(args.videos, args.workers)
+        ask = asyncio.run(run_ask(args.ask_requests, args.ask_concurrency))
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "ingest": ingest,
+        "ask": ask,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["regressions"] = compare(result, json.load(f), args.max_regression)
+
+    document = json.dumps(result, indent=2)
+    print(document)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+    if result.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# fakes.py
+"""
+Local stand-ins for OpenAI, Pinecone and Mongo used by the benchmark scripts.
+
+Each fake sleeps for a configurable per-request latency so that round-trip
+counts show up in wall-clock numbers the same way they do against the real
+services. Call `install_fakes()` before importing any project module.
+
+`install_pipeline_fakes()` additionally covers what the ingest pipeline
+touches: YouTube (deterministic transcript fixtures and watch-page
+metadata), the crew's summarizer LLM, Redis (fakeredis) and the worker's
+synchronous Mongo client (mongomock). It needs `pip install fakeredis lupa
+mongomock`.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+EMBEDDING_DIMENSION = 1536
+
+
+def fake_embedding(text: str) -> list:
+    """
+    Deterministic pseudo-embedding derived from the text's hash, so identical
+    texts map to identical vectors.
+    """
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    values = [((seed[i % len(seed)] + i) % 255) / 255.0 - 0.5 for i in range(EMBEDDING_DIMENSION)]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class FakeRawResponse:
+    """What `with_raw_response.create` returns: headers plus the parsed result."""
+
+    def __init__(self, parsed):
+        self.headers = {}
+        self._parsed = parsed
+
+    def parse(self):
+        return self._parsed
+
+
+class FakeEmbeddings:
+    def __init__(self, stats, latency):
+        self.stats = stats
+        self.latency = latency
+        self.with_raw_response = SimpleNamespace(create=lambda **kwargs: FakeRawResponse(self.create(**kwargs)))
+
+    def create(self, input, model):
+        self.stats["embedding_requests"] += 1
+        self.stats["embedded_texts"] += len(input)
+        time.sleep(self.latency)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_embedding(text))
+            for i, text in enumerate(input)
+        ])
+
+
+class FakeChatCompletions:
+    def __init__(self, stats, latency):
+        self.stats = stats
+        self.latency = latency
+
+    def create(self, model, messages, **kwargs):
+        self.stats["chat_requests"] += 1
+        time.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        return SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content=f"Fake answer ({len(prompt)} prompt chars)"))
+        ])
+
+
+class FakeOpenAI:
+    """Minimal `openai.OpenAI` replacement covering the calls this project makes."""
+    latency = 0.05
+    stats = {"embedding_requests": 0, "embedded_texts": 0, "chat_requests": 0}
+
+    def __init__(self, *args, **kwargs):
+        self.embeddings = FakeEmbeddings(self.stats, self.latency)
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(self.stats, self.latency))
+
+
+class FakeAsyncOpenAI:
+    """`openai.AsyncOpenAI` replacement; sleeps with asyncio so the event loop stays free."""
+    latency = 0.05
+
+    def __init__(self, *args, **kwargs):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self._create_completion,
+            with_raw_response=SimpleNamespace(create=self._create_raw_completion),
+        ))
+
+    async def _create_raw_completion(self, **kwargs):
+        return FakeRawResponse(await self._create_completion(**kwargs))
+
+    async def _create_completion(self, model, messages, stream=False, **kwargs):
+        FakeOpenAI.stats["chat_requests"] += 1
+        prompt = messages[-1]["content"]
+        answer = f"Fake answer ({len(prompt)} prompt chars)"
+        if stream:
+            return self._stream(answer.split(" "))
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content=answer))
+        ])
+
+    async def _stream(self, words):
+        # Spread the completion latency over the streamed pieces
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            piece = word if i == 0 else " " + word
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+def _matches(document: dict, query: dict) -> bool:
+    return all(
+        document.get(key) in value["$in"] if isinstance(value, dict) and "$in" in value
+        else document.get(key) == value
+        for key, value in query.items()
+    )
+
+
+class FakeAsyncCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield dict(document)
+
+
+class FakeAsyncCollection:
+    """In-memory stand-in for the subset of AsyncCollection the API uses (equality and $in filters only)."""
+
+    def __init__(self):
+        self.documents = []
+
+    async def find_one(self, query, projection=None):
+        for document in self.documents:
+            if _matches(document, query):
+                return dict(document)
+        return None
+
+    def find(self, query, projection=None):
+        return FakeAsyncCursor([d for d in self.documents if _matches(d, query)])
+
+    async def insert_one(self, document):
+        document.setdefault("_id", ObjectId())
+        self.documents.append(dict(document))
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    async def count_documents(self, query):
+        return sum(1 for d in self.documents if _matches(d, query))
+
+
+class FakeAsyncMongoClient:
+    databases = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, FakeAsyncDatabase())
+
+
+class FakeAsyncDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeAsyncCollection())
+
+
+class FakeIndex:
+    latency = 0.03
+    stats = {"upsert_requests": 0, "query_requests": 0}
+
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, vectors):
+        self.stats["upsert_requests"] += 1
+        time.sleep(self.latency)
+        for vector_id, values, metadata in vectors:
+            self.vectors[vector_id] = (values, metadata)
+
+    def query(self, vector, top_k, filter=None, include_metadata=False):
+        self.stats["query_requests"] += 1
+        time.sleep(self.latency)
+        filter = filter or {}
+        scored = []
+        for vector_id, (values, metadata) in self.vectors.items():
+            if any(metadata.get(k) != v for k, v in filter.items()):
+                continue
+            score = sum(a * b for a, b in zip(vector, values))
+            scored.append({"id": vector_id, "score": score, "metadata": metadata})
+        scored.sort(key=lambda m: m["score"], reverse=True)
+        return {"matches": scored[:top_k]}
+
+
+class FakePinecone:
+    """Minimal `pinecone.Pinecone` replacement backed by a single in-memory index."""
+    index = FakeIndex()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def list_indexes(self):
+        return SimpleNamespace(names=lambda: [os.getenv("PINECONE_INDEX_NAME", "youtube-summaries")])
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def Index(self, name):
+        return self.index
+
+
+def install_fakes(openai_latency: float = 0.05, pinecone_latency: float = 0.03):
+    """
+    Replaces the OpenAI, Pinecone and async Mongo client classes with the fakes above.
+    Must run before `agent.tasks` / `utils` are imported.
+    """
+    import openai
+    import pinecone
+    import pymongo
+
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    os.environ.setdefault("PINECONE_API_KEY", "fake-key")
+    # The fakes have no rate limits, and the runs shouldn't need Redis
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    FakeOpenAI.latency = openai_latency
+    FakeAsyncOpenAI.latency = openai_latency
+    FakeIndex.latency = pinecone_latency
+    openai.OpenAI = FakeOpenAI
+    openai.AsyncOpenAI = FakeAsyncOpenAI
+    pinecone.Pinecone = FakePinecone
+    pymongo.AsyncMongoClient = FakeAsyncMongoClient
+
+
+FIXTURE_VOCABULARY = (
+    "model data training latency vector index query summary transcript video "
+    "embedding token batch worker queue cache network request response chunk "
+    "the a of and to in is that it for on with as this we you can will"
+).split()
+
+
+def fake_transcript_segments(video_id: str, minutes: int = 10, segment_seconds: float = 4.0) -> list:
+    """
+    Deterministic transcript fixture for `video_id`: `minutes` of
+    {"text", "start", "duration"} segments, about 12 words each, so the same
+    video always chunks and embeds identically across runs.
+    """
+    rng = random.Random(video_id)
+    segments = []
+    for i in range(int(minutes * 60 / segment_seconds)):
+        words = [rng.choice(FIXTURE_VOCABULARY) for _ in range(12)]
+        segments.append({"text": " ".join(words) + ".", "start": i * segment_seconds, "duration": segment_seconds})
+    return segments
+
+
+class PipelineLatency:
+    """Per-call latencies (seconds) of the pipeline fakes, set by `install_pipeline_fakes`."""
+    transcript = 0.3
+    summarizer = 1.0
+    watch_page = 0.2
+    transcript_minutes = 10
+
+
+def install_pipeline_fakes(transcript_latency: float = 0.3, summarizer_latency: float = 1.0,
+                           watch_page_latency: float = 0.2, transcript_minutes: int = 10,
+                           mongo_uri: str = None):
+    """
+    Replaces YouTube, the summarizer LLM, Redis and the synchronous Mongo
+    client. Call after `install_fakes()` and before importing `agent.tasks`.
+    With `mongo_uri` the worker uses that (local) Mongo instead of mongomock.
+    """
+    import fakeredis
+    import mongomock
+    import pymongo
+    import redis
+    import redis.asyncio
+
+    PipelineLatency.transcript = transcript_latency
+    PipelineLatency.summarizer = summarizer_latency
+    PipelineLatency.watch_page = watch_page_latency
+    PipelineLatency.transcript_minutes = transcript_minutes
+
+    # One fake server, so every module's client sees the same keys
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+    redis.asyncio.Redis.from_url = classmethod(
+        lambda cls, url, **kwargs: fakeredis.aioredis.FakeRedis(server=server, **kwargs))
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+    else:
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import agent.tools
+    import agent.metadata
+    import crew
+
+    def get_transcript(video_id, languages=None):
+        time.sleep(PipelineLatency.transcript)
+        return fake_transcript_segments(video_id, PipelineLatency.transcript_minutes)
+
+    def scrape_watch_page(video):
+        time.sleep(PipelineLatency.watch_page)
+        return {"title": f"Fixture video {video.video_id}", "duration": PipelineLatency.transcript_minutes * 60}
+
+    def summarize(self, description, expected_output=None):
+        completions = FakeChatCompletions(FakeOpenAI.stats, PipelineLatency.summarizer)
+        response = completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": description}])
+        summary = response.choices[0].message.content
+        prompt_tokens, completion_tokens = len(description) // 4, len(summary) // 4
+        return summary, {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "successful_requests": 1,
+        }
+
+    agent.tools.YouTubeTranscriptApi.get_transcript = staticmethod(get_transcript)
+    agent.metadata.scrape_watch_page = scrape_watch_page
+    crew.YTSummaryCrew._summarize = summarize
+
+
+def reset_stats():
+    for stats in (FakeOpenAI.stats, FakeIndex.stats):
+        for key in stats:
+            stats[key] = 0
@@ -1,31 +1,192 @@
 from agent.tools import YouTubeTranscriptTool
-from crewai import Agent, Task, Crew, Process
+from agent.rate_limit import install_litellm_hooks
+from agent.metrics import record_tokens
+from crewai import Agent, Task, Crew, Process, LLM
+from concurrent.futures import ThreadPoolExecutor
 import os
 
 os.environ['CREWAI_TRACKING'] = 'false'
 
+# The crew's LLM calls go through litellm; share the OpenAI rate limit with them
+LITELLM_HOOKS = install_litellm_hooks()
+
+# crewai's own default model, resolved the same way it does
+CREW_LLM_MODEL = os.getenv("MODEL") or os.getenv("OPENAI_MODEL_NAME") or "gpt-4.1-mini"
+
+class RateLimitedLLM(LLM):
+    """
+    litellm-backed crewai LLM whose calls always carry the rate-limit hooks.
+    Agents pass their own callbacks with every call and crewai replaces
+    litellm's callback list with them, which would drop the hooks.
+    """
+    def call(self, messages, tools=None, callbacks=None, *args, **kwargs):
+        if LITELLM_HOOKS is not None:
+            callbacks = [*(callbacks or []), LITELLM_HOOKS]
+        return super().call(messages, tools, callbacks, *args, **kwargs)
+
+def crew_llm() -> LLM:
+    """
+    The agents' LLM. crewai calls OpenAI models through its native client
+    unless told otherwise, which would bypass the litellm hooks.
+    """
+    return RateLimitedLLM(model=CREW_LLM_MODEL, is_litellm=True)
+
+# "single" summarizes the whole transcript in one task; "map_reduce" summarizes
+# sections concurrently and then combines them; "auto" picks map_reduce when the
+# transcript is longer than one section.
+CREW_SUMMARY_MODE = os.getenv("CREW_SUMMARY_MODE", "auto")
+SUMMARY_SECTION_WORDS = int(os.getenv("SUMMARY_SECTION_WORDS", "3000"))
+SUMMARY_MAP_WORKERS = int(os.getenv("SUMMARY_MAP_WORKERS", "4"))
+
+SUMMARY_EXPECTED_OUTPUT = 'Bullet-point summary with key points and main conclusions'
+
+def split_into_sections(text: str, section_words: int) -> list:
+    """
+    Splits `text` into consecutive sections of at most `section_words` words.
+    """
+    words = text.split()
+    return [" ".join(words[i:i + section_words]) for i in range(0, len(words), section_words)]
+
+def record_crew_usage(token_usage: dict):
+    """Adds one crew run's token usage to the OpenAI token and cost counters."""
+    record_tokens(CREW_LLM_MODEL, token_usage.get("prompt_tokens"), token_usage.get("completion_tokens"),
+                  requests=token_usage.get("successful_requests") or 1)
+
+def merge_token_usage(usages: list) -> dict:
+    """Sums crew token usage dicts field by field."""
+    merged = {}
+    for usage in usages:
+        for key, value in usage.items():
+            merged[key] = merged.get(key, 0) + (value or 0)
+    return merged
+
 class YTSummaryCrew:
     def __init__(self, youtube_url:str):
         self.youtube_url = youtube_url
         self.transcript_tool = YouTubeTranscriptTool()
-    def run(self):
+
+    def fetch_segments(self) -> list:
+        """
+        Fetches the timestamped transcript segments straight from the tool,
+        without an LLM round trip.
+        """
+        video_id = self.transcript_tool.extract_video_id(self.youtube_url)
+        if not video_id:
+            raise ValueError(f"Could not extract a video ID from {self.youtube_url}")
+        try:
+            return self.transcript_tool.get_transcript_segments(video_id)
+        except Exception as e:
+            raise ValueError(f"Error: No suitable transcript found. {str(e)}")
+
+    def summarize(self, transcript: str, summary_mode: str = None,
+                  section_words: int = SUMMARY_SECTION_WORDS, max_workers: int = SUMMARY_MAP_WORKERS):
+        """
+        Summarizes an already fetched transcript. Returns {"transcript",
+        "summary", "token_usage"}. `summary_mode` is "single", "map_reduce"
+        or "auto" (defaults to CREW_SUMMARY_MODE).
+        """
+        summary_mode = summary_mode or CREW_SUMMARY_MODE
+        sections = split_into_sections(transcript, section_words)
+        if summary_mode == "map_reduce" or (summary_mode == "auto" and len(sections) > 1):
+            return self._run_map_reduce(transcript, sections, max_workers)
+        if summary_mode in ("single", "auto"):
+            return self._run_direct(transcript)
+        raise ValueError(f"Unknown summary mode: {summary_mode}")
+
+    def _summarizer(self):
+        return Agent(
+            role='Professional Summarizer',
+            goal='Create concise and informative summaries',
+            backstory='Expert in distilling complex information into key points and providing extremely valuable insights and details',
+            llm=crew_llm(),
+            verbose=True,
+            allow_delegation=False,
+        )
+
+    def _summarize(self, description: str, expected_output: str = SUMMARY_EXPECTED_OUTPUT):
+        """
+        Runs a one-task summarizer crew and returns (summary, token_usage).
+        Each call builds its own agent and crew so calls can run in parallel.
+        """
+        summary_task = Task(
+            description=description,
+            agent=self._summarizer(),
+            expected_output=expected_output,
+        )
+
+        crew = Crew(
+            agents=[summary_task.agent],
+            tasks=[summary_task],
+            process=Process.sequential,
+            verbose=True
+        )
+
+        output = crew.kickoff()
+        token_usage = output.token_usage.model_dump()
+        # Recorded per crew run, so every map and reduce call is counted
+        record_crew_usage(token_usage)
+        return str(summary_task.output), token_usage
+
+    def _run_direct(self, transcript: str):
+        summary, token_usage = self._summarize(
+            f'Create comprehensive summary of the following video transcript:\n\n{transcript}'
+        )
+        return {
+            "transcript": transcript,
+            "summary": summary,
+            "token_usage": token_usage,
+        }
+
+    def _run_map_reduce(self, transcript: str, sections: list, max_workers: int):
+        """
+        Map: summarizes each transcript section in a bounded thread pool.
+        Reduce: combines the section summaries into the comprehensive summary.
+        """
+        total = len(sections)
+
+        def summarize_section(args):
+            index, section = args
+            return self._summarize(
+                f'Summarize part {index + 1} of {total} of a video transcript. '
+                f'Keep every key point, name, number and conclusion:\n\n{section}',
+                expected_output='Detailed bullet-point notes for this part of the video',
+            )
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            section_results = list(executor.map(summarize_section, enumerate(sections)))
+
+        section_summaries = "\n\n".join(
+            f"Part {index + 1}:\n{summary}" for index, (summary, _) in enumerate(section_results)
+        )
+        summary, reduce_usage = self._summarize(
+            'Create comprehensive summary of a video from the following notes, '
+            f'which cover its {total} parts in order:\n\n{section_summaries}'
+        )
+        return {
+            "transcript": transcript,
+            "summary": summary,
+            "token_usage": merge_token_usage([usage for _, usage in section_results] + [reduce_usage]),
+        }
+
+    def summarize_with_researcher(self):
+        """
+        The original pipeline, where an LLM researcher agent calls the
+        transcript tool before the summarizer runs. Ingest never uses it (the
+        transcript stage fetches the transcript directly); it is kept as the
+        baseline for benchmarks/bench_crew_modes.py.
+        """
         # Define agents
         researcher = Agent(
             role='YouTube Researcher',
             goal='Extract and analyze video content',
             backstory='Expert in understanding and processing video content',
             tools=[self.transcript_tool],
+            llm=crew_llm(),
             verbose=True,
             allow_delegation=False,
         )
 
-        summarizer = Agent(
-            role='Professional Summarizer',
-            goal='Create concise and informative summaries',
-            backstory='Expert in distilling complex information into key points and providing extremely valuable insights and details',
-            verbose=True,
-            allow_delegation=False,
-        )
+        summarizer = self._summarizer()
 
         # qna_summarizer = Agent(
         #     role='QnA Summarizer',
@@ -64,8 +225,11 @@ class YTSummaryCrew:
             verbose=True
         )
 
-        crew.kickoff()
+        output = crew.kickoff()
+        token_usage = output.token_usage.model_dump()
+        record_crew_usage(token_usage)
         return {
             "transcript": str(transcript_task.output),
             "summary": str(summary_task.output),
+            "token_usage": token_usage,
         }
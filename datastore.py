@@ -0,0 +1,35 @@
+# datastore.py
+"""
+Async data-access layer for the FastAPI app.
+
+Handlers must not block the event loop, so Mongo and OpenAI are reached
+through their async clients here, and the remaining synchronous SDKs
+(Pinecone, Redis, Celery, the embedding cache) are pushed to a worker
+thread with `run_blocking`. The clients themselves are the process' shared
+ones from `agent.clients`.
+"""
+import os
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.clients import get_async_db
+
+db = get_async_db()
+
+# Define collections (for example, 'users' and 'blogs')
+users_collection = db["users"]
+blogs_collection = db["blogs"]
+# Shared per-video artifacts (transcript, summary, chunk vectors), keyed by video ID
+videos_collection = db["videos"]
+
+# Blocking SDK calls are network-bound, so the pool is sized for I/O rather
+# than CPU count (asyncio's default pool is only cpu_count + 4 threads).
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "64"))
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs a synchronous call in the blocking-I/O thread pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(fn, *args, **kwargs))
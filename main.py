@@ -1,16 +1,38 @@
-from fastapi import FastAPI,HTTPException,Body
+from fastapi import FastAPI,HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel,EmailStr
-import os
-from pymongo import MongoClient
-from crew import YTSummaryCrew
+import time
+import asyncio
+import logging
 from datetime import datetime
 from bson import ObjectId
-from typing import Optional
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
+from typing import Optional, List
 import json
-from openai import OpenAI
+from contextlib import asynccontextmanager
+from datastore import db, users_collection, blogs_collection, videos_collection, run_blocking
+from schema import aensure_indexes
+from agent.clients import aclose_clients
+from agent.vector_store import ensure_vector_index
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the indexes the hot queries rely on before serving requests
+    await aensure_indexes(db)
+    try:
+        await run_blocking(ensure_vector_index)
+    except Exception as e:
+        logger.error(f"Failed to provision the vector index: {str(e)}")
+    yield
+    await aclose_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,24 +45,10 @@ app.add_middleware(
 def root():
     return {"Welcome to the project YT-CREW"}
 
-# Connect to MongoDB
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-DB_NAME = os.getenv("DB_NAME", "yt-crew")
-client = MongoClient(MONGO_URI)
-
-db = client[DB_NAME]
-
-# Define collections (for example, 'users' and 'blogs')
-users_collection = db["users"]
-blogs_collection = db["blogs"]
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
 @app.get("/db-check")
-def db_check():
+async def db_check():
     # Just a quick check by counting documents in your 'users' collection
-    count_users = users_collection.count_documents({})
+    count_users = await users_collection.count_documents({})
     return {"message": "Connected to MongoDB successfully!", "users_count": count_users}
 
 class User(BaseModel):
@@ -69,17 +77,21 @@ class QueryRequest(BaseModel):
 
 @app.post("/users")
 async def create_user(user: User):
-    if users_collection.find_one({"email": user.email}):
+    # Fast path only: the unique email index settles concurrent sign-ups
+    if await users_collection.find_one({"email": user.email}):
         raise HTTPException(status_code=400, detail="User already exists")
     
     user_dict = UserInDB(**user.dict()).dict()
-    result = users_collection.insert_one(user_dict)
+    try:
+        result = await users_collection.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
     return {"id": str(result.inserted_id), "message": "User created successfully"}
 
 @app.get("/users/{user_id}")
 async def get_user(user_id: str):
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await users_collection.find_one({"_id": ObjectId(user_id)})
         if user:
             user["_id"] = str(user["_id"])
             return user
@@ -87,20 +99,34 @@ async def get_user(user_id: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
-from agent.tasks import process_video_task, celery_app
+from agent.tasks import process_video_task, celery_app, task_finished
+from agent.video import VideoRef
+from agent.artifacts import afind_video_artifacts, alink_blog_to_artifacts, ahydrate_blogs
+from agent.inflight import claim_or_take_over, current_owner, add_waiter, release_video
+from agent.progress import subscribe_progress
 from celery.result import AsyncResult
+from uuid import uuid4
 
 
 @app.post("/process-video")
 async def process_video(request: VideoRequest):
     try:
-        user = users_collection.find_one({"_id": ObjectId(request.user_id)})
-        if not user:
-            return HTTPException(status_code=404, detail="User not found")
+        user = await users_collection.find_one({"_id": ObjectId(request.user_id)})
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
-        existing_blog = blogs_collection.find_one({
-            "youtube_url": request.youtube_url,
-            "user_id": request.user_id
+    try:
+        # Every URL form of a video maps to one VideoRef, so dedup keys on its ID
+        video = VideoRef.parse(request.youtube_url)
+        if not video:
+            raise HTTPException(status_code=400, detail="Invalid YouTube URL")
+        video_id = video.video_id
+
+        existing_blog = await blogs_collection.find_one({
+            "user_id": request.user_id,
+            "video_id": video_id
         })
 
         # extract content from existing blog
@@ -113,6 +139,17 @@ async def process_video(request: VideoRequest):
                 "blog_id": str(existing_blog["_id"]),
                 "content": existing_blog_content
         }
+
+        # Another user already processed this video: link to the shared artifacts
+        artifacts = await afind_video_artifacts(videos_collection, video_id)
+        if artifacts:
+            blog_id = await alink_blog_to_artifacts(blogs_collection, request.user_id, video.url, artifacts)
+            return {
+                "status": "success",
+                "blog_id": blog_id,
+                "content": None
+            }
+
         # summary_crew = YTSummaryCrew(request.youtube_url)
         # result = summary_crew.run()
         # print("result received",result)
@@ -129,7 +166,36 @@ async def process_video(request: VideoRequest):
         # )
         
         # inserted = blogs_collection.insert_one(blog_post.dict())
-        task = process_video_task.delay(request.user_id, request.youtube_url)
+
+        # Coalesce with a task that is already processing this video, if any.
+        # Redis and the Celery broker are synchronous clients, so run them off the event loop.
+        task_id = str(uuid4())
+        owner_task_id = await run_blocking(claim_or_take_over, video_id, task_id, task_finished)
+
+        if owner_task_id:
+            await run_blocking(add_waiter, video_id, request.user_id, video.url)
+            # The owner may have finished while we were attaching; if so, link directly
+            if await run_blocking(current_owner, video_id) != owner_task_id:
+                artifacts = await afind_video_artifacts(videos_collection, video_id)
+                if artifacts and not await blogs_collection.find_one({"user_id": request.user_id, "video_id": video_id}):
+                    blog_id = await alink_blog_to_artifacts(blogs_collection, request.user_id, video.url, artifacts)
+                    return {
+                        "status": "success",
+                        "blog_id": blog_id,
+                        "content": None
+                    }
+            return {
+                "task_id": owner_task_id,
+                "status": "processing",
+                "coalesced": True
+            }
+
+        try:
+            task = await run_blocking(process_video_task.apply_async, (request.user_id, video.url), task_id=task_id)
+        except Exception:
+            # Nothing will ever run under this task ID; don't let requests attach to it
+            await run_blocking(release_video, video_id, task_id)
+            raise
 
         return {
             "task_id": task.id,
@@ -137,46 +203,229 @@ async def process_video(request: VideoRequest):
         }
 
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+class BatchRequest(BaseModel):
+    user_id: str
+    youtube_urls: List[str] = []
+    playlist_url: Optional[str] = None
+    max_concurrency: Optional[int] = None
+
+from collections import Counter
+import requests
+from agent.video import parse_playlist_id
+from agent.metadata import fetch_playlist_video_ids
+from agent.batch import BATCH_MAX_CONCURRENCY, BATCH_MAX_VIDEOS, create_batch, get_batch
+from agent.tasks import schedule_batch
+
+
+@app.post("/batches")
+async def create_batch_ingest(request: BatchRequest):
+    """
+    Bulk ingestion of a list of URLs and/or a playlist for one user.
+    Videos are deduplicated by video ID; ones the user already has a blog
+    for, or that were already processed for another user, complete right
+    away. The rest run on the bulk queue, at most `max_concurrency` at a
+    time (capped at BATCH_MAX_CONCURRENCY). Returns the batch ID and its
+    aggregate status (see GET /batches/{batch_id}).
+    """
+    try:
+        user = await users_collection.find_one({"_id": ObjectId(request.user_id)})
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    urls = list(request.youtube_urls)
+    if request.playlist_url:
+        playlist_id = parse_playlist_id(request.playlist_url)
+        if not playlist_id:
+            raise HTTPException(status_code=400, detail="Invalid YouTube playlist URL")
+        try:
+            playlist_video_ids = await run_blocking(fetch_playlist_video_ids, playlist_id)
+        except requests.RequestException as e:
+            raise HTTPException(status_code=502, detail=f"Could not fetch the playlist: {str(e)}")
+        urls.extend(VideoRef(video_id).url for video_id in playlist_video_ids)
+
+    videos, invalid_urls = {}, []
+    for url in urls:
+        video = VideoRef.parse(url)
+        if video:
+            videos.setdefault(video.video_id, video)
+        else:
+            invalid_urls.append(url)
+    if not videos:
+        raise HTTPException(status_code=400, detail="No valid YouTube URLs in the batch")
+    if len(videos) > BATCH_MAX_VIDEOS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {BATCH_MAX_VIDEOS} videos")
+
+    video_ids = list(videos)
+    items = {video_id: {"youtube_url": video.url, "status": "queued"} for video_id, video in videos.items()}
+
+    # Deduplicate against the user's blogs, then against other users' processed videos
+    async for blog in blogs_collection.find({"user_id": request.user_id, "video_id": {"$in": video_ids}}, {"video_id": 1}):
+        items[blog["video_id"]].update(status="completed", blog_id=str(blog["_id"]))
+    queued_ids = [video_id for video_id in video_ids if items[video_id]["status"] == "queued"]
+    async for artifacts in videos_collection.find({"_id": {"$in": queued_ids}}):
+        blog_id = await alink_blog_to_artifacts(blogs_collection, request.user_id, videos[artifacts["_id"]].url, artifacts)
+        items[artifacts["_id"]].update(status="completed", blog_id=blog_id)
+
+    max_concurrency = max(1, min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    batch_id = await run_blocking(create_batch, request.user_id, items, max_concurrency)
+    await run_blocking(schedule_batch, batch_id)
+
+    status = await get_batch_status(batch_id)
+    status["invalid_urls"] = invalid_urls
+    return status
+
+
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """
+    Aggregate status of a batch: "processing" until every video has
+    completed or failed, counts per item status, and each item's status,
+    task_id and blog_id.
+    """
+    meta, items = await run_blocking(get_batch, batch_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    # Videos attached to another request's task complete when that task links their blog
+    coalesced = [video_id for video_id, item in items.items() if item["status"] == "coalesced"]
+    if coalesced:
+        async for blog in blogs_collection.find({"user_id": meta["user_id"], "video_id": {"$in": coalesced}}, {"video_id": 1}):
+            items[blog["video_id"]].update(status="completed", blog_id=str(blog["_id"]))
+        for video_id in coalesced:
+            item = items[video_id]
+            if item["status"] == "coalesced" and await run_blocking(current_owner, video_id) != item["task_id"]:
+                item.update(status="failed", error="The task this video was attached to finished without a blog")
+
+    counts = Counter(item["status"] for item in items.values())
+    done = counts["completed"] + counts["failed"]
+    return {
+        "batch_id": batch_id,
+        "status": "completed" if done == len(items) else "processing",
+        "total": len(items),
+        "counts": dict(counts),
+        "items": [{"video_id": video_id, **item} for video_id, item in items.items()],
+    }
+
+# Fields returned by the blog list view; the full blog (transcript, summary)
+# is fetched per blog with /blog/{blog_id} or in bulk with the export endpoint.
+BLOG_LIST_PROJECTION = {"video_title": 1, "thumbnail": 1, "youtube_url": 1, "created_at": 1}
+BLOG_PAGE_MAX_LIMIT = 100
+EXPORT_BATCH_SIZE = 50
+
+def blog_list_item(blog: dict) -> dict:
+    # Older blogs have no created_at; the ObjectId's timestamp is the insert time
+    blog["created_at"] = blog.get("created_at") or blog["_id"].generation_time
+    blog["_id"] = str(blog["_id"])
+    return blog
+
 # api for getting all blocks based on userid
 @app.get("/blogs/{user_id}")
-async def get_blogs(user_id: str):
-    blogs = blogs_collection.find({"user_id": user_id})
-    blog_list = []
-    for blog in blogs:
-        blog["_id"] = str(blog["_id"])
-        blog_list.append(blog)
-    return blog_list
+async def get_blogs(user_id: str, limit: int = 20, cursor: Optional[str] = None):
+    """
+    Lists a user's blogs, newest first, one page at a time. Only list-view
+    fields are returned. Pass the returned `next_cursor` as `cursor` to get
+    the next page; it is null on the last page.
+    """
+    limit = max(1, min(limit, BLOG_PAGE_MAX_LIMIT))
+    query = {"user_id": user_id}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$lt": ObjectId(cursor)}
+
+    # Fetch one extra document to know whether another page exists
+    blogs = blogs_collection.find(query, BLOG_LIST_PROJECTION).sort("_id", -1).limit(limit + 1)
+    blog_list = [blog_list_item(blog) async for blog in blogs]
+    next_cursor = blog_list[limit - 1]["_id"] if len(blog_list) > limit else None
+    return {"blogs": blog_list[:limit], "next_cursor": next_cursor}
+
+@app.get("/blogs/{user_id}/export")
+async def export_blogs(user_id: str):
+    """
+    Streams every blog of a user, with all fields, as one JSON array. Documents
+    are read from Mongo in batches and written out as they arrive, so the
+    export never has to fit in memory.
+    """
+    async def export_batch(batch: list) -> str:
+        # One videos lookup per batch fills in the linked blogs' transcripts and summaries
+        await ahydrate_blogs(videos_collection, batch)
+        for blog in batch:
+            blog["_id"] = str(blog["_id"])
+        return ",".join(json.dumps(blog, default=str) for blog in batch)
+
+    async def json_array():
+        yield "["
+        first, batch = True, []
+        async for blog in blogs_collection.find({"user_id": user_id}).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE):
+            batch.append(blog)
+            if len(batch) == EXPORT_BATCH_SIZE:
+                yield ("" if first else ",") + await export_batch(batch)
+                first, batch = False, []
+        if batch:
+            yield ("" if first else ",") + await export_batch(batch)
+        yield "]"
+
+    return StreamingResponse(
+        json_array(),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="blogs-{user_id}.json"'},
+    )
 
 # api for getting a single blog based on blogid
 @app.get("/blog/{blog_id}")
 async def get_blog(blog_id: str):
-    blog = blogs_collection.find_one({"_id": ObjectId(blog_id)})
+    try:
+        blog = await blogs_collection.find_one({"_id": ObjectId(blog_id)})
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid blog ID")
     if blog:
+        await ahydrate_blogs(videos_collection, [blog])
         blog["_id"] = str(blog["_id"])
         return blog
     raise HTTPException(status_code=404, detail="Blog not found")
 
+async def find_task_blog(blog_id: str, user_id: str) -> dict:
+    """
+    Returns `user_id`'s blog from a finished task: the blog the task created,
+    or - for a request coalesced onto another user's task - the user's own
+    blog for the same video. Another user's blog is never returned.
+    """
+    blog = await blogs_collection.find_one({"_id": ObjectId(blog_id)})
+    if blog and blog["user_id"] != user_id:
+        blog = await blogs_collection.find_one({"user_id": user_id, "video_id": blog.get("video_id")})
+    if blog:
+        await ahydrate_blogs(videos_collection, [blog])
+        blog["_id"] = str(blog["_id"])
+    return blog
+
 @app.get("/task/{task_id}")
-async def get_task_status(task_id: str):
+async def get_task_status(task_id: str, user_id: str):
     """
     Poll the Celery task by its ID.
-    If finished successfully, retrieve the created blog from Mongo and return it.
+    If finished successfully, retrieve the requesting `user_id`'s blog from
+    Mongo and return it; requests coalesced onto another user's task share
+    its task_id, so the blog is always looked up for the caller. Prefer
+    /task/{task_id}/events, which pushes progress instead of being polled.
     """
     task_result = AsyncResult(task_id, app=celery_app)
 
-    if task_result.ready():
+    # AsyncResult talks to the result backend synchronously
+    if await run_blocking(task_result.ready):
         if task_result.successful():
             # The task returns the blog_id as result
             blog_id = task_result.result
             # If it started with 'Error', treat it as a failure
             if blog_id.startswith("Error"):
                 return {"status": "failed", "error": blog_id}
-            blog = blogs_collection.find_one({"_id": ObjectId(blog_id)})
+            blog = await find_task_blog(blog_id, user_id)
             if blog:
-                blog["_id"] = str(blog["_id"])
                 return {
                     "status": "completed",
                     "blog": blog
@@ -189,41 +438,199 @@ async def get_task_status(task_id: str):
     # Task is still running
     return {"status": "processing"}
 
-from utils import get_blog_by_user_and_title, fetch_summary_text, fetch_relevant_transcript_chunks, build_answer_prompt, call_openai_for_answer
-
-@app.post("/ask")
-async def answer_query(request: QueryRequest):
+@app.get("/task/{task_id}/events")
+async def task_events(task_id: str, user_id: str):
+    """
+    Pushes a task's progress over Server-Sent Events instead of polling:
+      - "progress" events for each stage (transcript_fetched, summarized,
+        chunks_embedded with done/total, metadata_fetched), including the
+        ones published before the client connected;
+      - then "completed" with the `user_id`'s blog (their own one for
+        coalesced requests) or "failed" with the error, and the stream ends.
     """
-    Answer a user's query by:
-      1. Retrieving the corresponding blog (to obtain the YouTube URL).
-      2. Querying Pinecone for the stored summary and the most relevant transcript chunks.
-      3. Building a prompt and calling OpenAI to generate an answer.
+    async def event_stream():
+        # Tasks that finished before their events could be replayed (or
+        # whose events expired) are answered from the result backend once
+        task_result = AsyncResult(task_id, app=celery_app)
+        if await run_blocking(task_result.ready):
+            status = await get_task_status(task_id, user_id)
+            yield sse_event(status["status"], status)
+            return
+
+        async for event in subscribe_progress(task_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            elif event["stage"] == "completed":
+                blog = await find_task_blog(event["blog_id"], user_id)
+                if blog:
+                    yield sse_event("completed", {"status": "completed", "blog": blog})
+                else:
+                    yield sse_event("failed", {"status": "failed", "error": "Blog not found after task"})
+            elif event["stage"] == "failed":
+                yield sse_event("failed", {"status": "failed", "error": event.get("error")})
+            else:
+                yield sse_event("progress", event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+from agent.tasks import get_embedding
+from agent.answer_cache import ANSWER_CACHE_ENABLED, lookup_answer, store_answer, answer_cache_stats
+from utils import get_blog_by_user_and_title, fetch_summary_text, fetch_relevant_transcript_chunks, build_answer_prompt, build_citations, call_openai_for_answer, stream_openai_answer, sse_event
+
+async def get_blog_for_query(request: QueryRequest) -> dict:
     """
-    blog = get_blog_by_user_and_title(request.user_id, request.video_title)
+    Retrieves the blog the question is about (to obtain the YouTube URL and video ID).
+    """
+    blog = await get_blog_by_user_and_title(request.user_id, request.video_title)
     if not blog:
         raise HTTPException(status_code=404, detail="Blog not found for the given user and video title.")
-    print("Blog found")
-    
+
     youtube_url = blog.get("youtube_url")
     if not youtube_url:
         raise HTTPException(status_code=500, detail="Blog is missing the YouTube URL.")
-    print(f"Youtube URL found")
+    return blog
 
-    # Fetch summary text from Pinecone (stored in metadata as "summary_text")
-    # summary_text = fetch_summary_text(blog.get("user_id"), youtube_url)
-    # if not summary_text:
-    #     raise HTTPException(status_code=500, detail="Summary vector not found in Pinecone.")
-    # print(f"Summary text found")
-    
-    # Fetch the most relevant transcript chunks using the user's query
-    transcript_chunks = fetch_relevant_transcript_chunks(request.user_id, youtube_url, request.query, top_k=5)
+async def lookup_cached_answer(request: QueryRequest, blog: dict):
+    """
+    Returns (cached, query_embedding) from the semantic answer cache, where
+    `cached` is {"answer", "citations"} or None on a miss; the embedding is None when the blog can't use
+    the cache (legacy blogs without a video ID) or the cache is disabled.
+    """
+    video_id = blog.get("video_id")
+    if not ANSWER_CACHE_ENABLED or not video_id:
+        return None, None
+    async with aspan("answer_cache_lookup", video_id=video_id):
+        query_embedding = await run_blocking(get_embedding, request.query)
+        cached = await run_blocking(lookup_answer, video_id, query_embedding)
+    return cached, query_embedding
+
+async def prepare_answer_prompt(request: QueryRequest, blog: dict):
+    """
+    Shared setup for /ask and /ask/stream:
+      1. Querying the vector store for the most relevant transcript chunks.
+      2. Building the prompt.
+    Returns (prompt, transcript_chunks) where each chunk is {"text", "start", "end"}.
+    """
+    youtube_url = blog.get("youtube_url")
+
+    # Fetch the most relevant transcript chunks using the user's query, and the
+    # video's summary alongside them
+    async with aspan("retrieve", video_id=blog.get("video_id")):
+        summary_text, transcript_chunks = await asyncio.gather(
+            fetch_summary_text(blog),
+            fetch_relevant_transcript_chunks(request.user_id, youtube_url, request.query, top_k=5,
+                                             video_id=blog.get("video_id")),
+        )
     if not transcript_chunks:
         raise HTTPException(status_code=500, detail="Relevant transcript chunks not found in Pinecone.")
 
     # Build the prompt for the answer
-    prompt = build_answer_prompt(request.query, blog.get("comprehensive_summary","No summary provided with this video, use your knowledge"), transcript_chunks)
-    print(f"Prompt for answer:\n{prompt}")
+    prompt = build_answer_prompt(request.query, summary_text or "No summary provided with this video, use your knowledge", [chunk["text"] for chunk in transcript_chunks])
+    logger.debug(f"Answer prompt for video_id={blog.get('video_id')}: {len(prompt)} chars, {len(transcript_chunks)} chunks")
+    return prompt, transcript_chunks
+
+@app.post("/ask")
+async def answer_query(request: QueryRequest):
+    """
+    Answer a user's query with the full answer in one JSON response.
+    Near-identical questions about the same video are served from the
+    semantic answer cache.
+    """
+    started = time.perf_counter()
+    blog = await get_blog_for_query(request)
+    cached, query_embedding = await lookup_cached_answer(request, blog)
+    if cached is not None:
+        return {"answer": cached["answer"], "citations": cached["citations"], "cached": True}
+
+    prompt, transcript_chunks = await prepare_answer_prompt(request, blog)
 
     # Call OpenAI to generate the answer
-    answer = call_openai_for_answer(prompt)
-    return {"answer": answer}
+    async with aspan("answer", video_id=blog.get("video_id")):
+        answer = await call_openai_for_answer(prompt)
+    citations = build_citations(blog["youtube_url"], blog.get("video_id"), transcript_chunks)
+    if query_embedding is not None:
+        await run_blocking(store_answer, blog["video_id"], query_embedding, answer,
+                           time.perf_counter() - started, citations)
+    return {"answer": answer, "citations": citations}
+
+@app.post("/ask/stream")
+async def answer_query_stream(request: QueryRequest):
+    """
+    Same as /ask, but streams the answer over Server-Sent Events:
+      - "token" events carry answer text as the model produces it,
+      - a final "done" event carries the transcript chunks used as context
+        and their jump-to-time citations,
+      - an "error" event is sent instead if generation fails midway.
+    Lookup errors (unknown blog, no chunks) are still returned as plain HTTP errors.
+    A cached answer is sent as a single "token" event followed by "done"
+    with `"cached": true`, its citations and no transcript chunks.
+    """
+    started = time.perf_counter()
+    blog = await get_blog_for_query(request)
+    cached, query_embedding = await lookup_cached_answer(request, blog)
+    if cached is not None:
+        async def cached_stream():
+            yield sse_event("token", {"token": cached["answer"]})
+            yield sse_event("done", {"transcript_chunks": [], "citations": cached["citations"], "cached": True})
+        return StreamingResponse(cached_stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    prompt, transcript_chunks = await prepare_answer_prompt(request, blog)
+
+    async def event_stream():
+        pieces = []
+        try:
+            async with aspan("answer", video_id=blog.get("video_id"), stream=True):
+                async for token in stream_openai_answer(prompt):
+                    pieces.append(token)
+                    yield sse_event("token", {"token": token})
+        except Exception as e:
+            logger.error(f"Error streaming OpenAI answer: {e}", exc_info=True)
+            yield sse_event("error", {"detail": "Error generating answer from OpenAI."})
+            return
+        citations = build_citations(blog["youtube_url"], blog.get("video_id"), transcript_chunks)
+        yield sse_event("done", {
+            "transcript_chunks": [chunk["text"] for chunk in transcript_chunks],
+            "citations": citations,
+        })
+        if query_embedding is not None:
+            answer = "".join(pieces).strip()
+            await run_blocking(store_answer, blog["video_id"], query_embedding, answer,
+                               time.perf_counter() - started, citations)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/ask/cache-stats")
+async def get_answer_cache_stats():
+    """Semantic answer cache hit rate and the answer latency it has saved."""
+    return await run_blocking(answer_cache_stats)
+
+from agent.embedding_cache import embedding_cache_stats
+
+@app.get("/embeddings/cache-stats")
+async def get_embedding_cache_stats():
+    """Embedding cache hit rate across the API and every worker."""
+    return await run_blocking(embedding_cache_stats)
+
+from fastapi.responses import PlainTextResponse
+from agent.rate_limit import rate_limit_stats
+from agent.metrics import aspan, render_prometheus
+
+@app.get("/rate-limits/stats")
+async def get_rate_limit_stats():
+    """Per-model OpenAI limiter counters: acquisitions, queueing delay and 429s."""
+    return await run_blocking(rate_limit_stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage latency histograms, OpenAI token/cost counters and Celery queue depths, in Prometheus format."""
+    body = await run_blocking(render_prometheus)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,212 @@
+# migrate_video_refs.py
+"""
+One-off migration of existing records to canonical video identity.
+
+  - "videos" documents and blogs that already have a video_id get the
+    canonical `VideoRef.url` as their youtube_url.
+  - Legacy blogs (created before per-video artifacts) are keyed by their raw
+    URL and own per-blog Pinecone vectors (`<blog_id>`, `<blog_id>_<i>`).
+    The first legacy blog of each video is promoted: its vectors are copied
+    to the video-keyed IDs and its transcript/summary become the video's
+    shared artifacts. Every legacy blog of that video then gets its video_id
+    set, so later requests for any URL form of it hit the shared artifacts.
+  - "videos" documents written before transcripts were compressed are
+    compacted (compressed transcript, chunk offsets), and blogs linked to a
+    video drop their own copies of its transcript and summary.
+
+Legacy vectors are left in place unless --delete-legacy is given. Blogs whose
+URL doesn't parse, or whose vectors can't be found, are left untouched (they
+keep working through the legacy user_id + youtube_url filter).
+
+    python -m migrate_video_refs [--dry-run] [--delete-legacy]
+"""
+import json
+import logging
+import argparse
+
+from agent.clients import get_db, get_pinecone_index
+from agent.video import VideoRef
+from agent.vector_store import get_vector_store
+from agent.artifacts import (
+    summary_vector_id, chunk_vector_id, find_video_artifacts, save_video_artifacts,
+    compress_text, chunk_offsets,
+)
+
+logger = logging.getLogger(__name__)
+
+FETCH_BATCH_SIZE = 100
+
+
+def _decode_field(value):
+    """Legacy blogs store the transcript and summary as JSON-encoded strings."""
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def fetch_legacy_vectors(blog_id: str):
+    """
+    Returns (summary_vector, [chunk_vector, ...]) for a legacy blog, each a
+    (values, metadata) pair, with chunks in chunk_index order. The summary is
+    None if the blog has no vectors.
+    """
+    response = get_pinecone_index().fetch(ids=[blog_id])
+    summary = response.vectors.get(blog_id)
+    if summary is None:
+        return None, []
+
+    chunks = []
+    start = 0
+    while True:
+        ids = [f"{blog_id}_{idx}" for idx in range(start, start + FETCH_BATCH_SIZE)]
+        found = get_pinecone_index().fetch(ids=ids).vectors
+        if not found:
+            # Chunks that failed to embed left gaps; a whole empty batch means we're past the end
+            break
+        chunks.extend(found[vector_id] for vector_id in ids if vector_id in found)
+        start += FETCH_BATCH_SIZE
+    chunks.sort(key=lambda vector: vector.metadata.get("chunk_index", 0))
+    return (summary.values, summary.metadata), [(vector.values, vector.metadata) for vector in chunks]
+
+
+def promote_legacy_blog(videos_collection, blog: dict, video: VideoRef, delete_legacy: bool):
+    """
+    Copies a legacy blog's vectors and content into the shared per-video
+    artifacts. Returns the artifacts, or None if the blog has no vectors.
+    """
+    blog_id = str(blog["_id"])
+    summary, chunk_vectors = fetch_legacy_vectors(blog_id)
+    if summary is None:
+        return None
+
+    video_title = blog.get("video_title")
+    summary_values, _ = summary
+    vectors = [(
+        summary_vector_id(video.video_id),
+        summary_values,
+        {"video_id": video.video_id, "type": "summary"},
+    )]
+    chunks = []
+    for idx, (values, metadata) in enumerate(chunk_vectors):
+        chunks.append({"text": metadata.get("chunk_text", ""), "start": None, "end": None})
+        vectors.append((
+            chunk_vector_id(video.video_id, idx),
+            values,
+            {"video_id": video.video_id, "type": "transcript_chunk", "chunk_index": idx},
+        ))
+
+    upsert_result = get_vector_store().upsert(vectors)
+    if upsert_result["failed_ids"]:
+        logger.error(f"Failed to copy vectors for blog_id={blog_id}: {upsert_result['failed_ids']}")
+        return None
+
+    artifacts = save_video_artifacts(
+        videos_collection,
+        video_id=video.video_id,
+        youtube_url=video.url,
+        video_title=video_title,
+        thumbnail_url=blog.get("thumbnail") or video.thumbnail_url,
+        transcript=_decode_field(blog.get("transcript")),
+        comprehensive_summary=_decode_field(blog.get("comprehensive_summary")),
+        chunks=chunks,
+    )
+    if delete_legacy:
+        get_pinecone_index().delete(ids=[blog_id] + [f"{blog_id}_{idx}" for idx in range(len(chunk_vectors))])
+    return artifacts
+
+
+def migrate(db, dry_run: bool = False, delete_legacy: bool = False) -> dict:
+    """Runs the migration and returns counts of what changed."""
+    blogs_collection = db["blogs"]
+    videos_collection = db["videos"]
+    counts = {"videos_canonicalized": 0, "blogs_canonicalized": 0, "videos_promoted": 0,
+              "legacy_blogs_linked": 0, "legacy_blogs_skipped": 0}
+
+    for artifacts in videos_collection.find({}, {"youtube_url": 1}):
+        url = VideoRef(artifacts["_id"]).url
+        if artifacts.get("youtube_url") != url:
+            counts["videos_canonicalized"] += 1
+            if not dry_run:
+                videos_collection.update_one({"_id": artifacts["_id"]}, {"$set": {"youtube_url": url}})
+
+    for blog in blogs_collection.find({"video_id": {"$exists": True}}, {"video_id": 1, "youtube_url": 1}):
+        url = VideoRef(blog["video_id"]).url
+        if blog.get("youtube_url") != url:
+            counts["blogs_canonicalized"] += 1
+            if not dry_run:
+                blogs_collection.update_one({"_id": blog["_id"]}, {"$set": {"youtube_url": url}})
+
+    for blog in blogs_collection.find({"video_id": {"$exists": False}}):
+        video = VideoRef.parse(blog.get("youtube_url"))
+        if not video:
+            logger.warning(f"Skipping blog_id={blog['_id']}: unrecognised URL {blog.get('youtube_url')}")
+            counts["legacy_blogs_skipped"] += 1
+            continue
+
+        if dry_run:
+            counts["legacy_blogs_linked"] += 1
+            continue
+
+        if not find_video_artifacts(videos_collection, video.video_id):
+            if not promote_legacy_blog(videos_collection, blog, video, delete_legacy):
+                logger.warning(f"Skipping blog_id={blog['_id']}: no legacy vectors found")
+                counts["legacy_blogs_skipped"] += 1
+                continue
+            counts["videos_promoted"] += 1
+
+        blogs_collection.update_one(
+            {"_id": blog["_id"]},
+            {"$set": {"video_id": video.video_id, "youtube_url": video.url}},
+        )
+        counts["legacy_blogs_linked"] += 1
+
+    compact(db, counts, dry_run)
+    return counts
+
+
+def compact(db, counts: dict, dry_run: bool = False):
+    """
+    Moves records written before compressed storage to the compact layout:
+    videos get a compressed transcript and chunk offsets (chunks that can't
+    be located keep their plain texts), and blogs linked to a stored video
+    drop their JSON-encoded transcript and summary copies.
+    """
+    blogs_collection = db["blogs"]
+    videos_collection = db["videos"]
+    counts.update(videos_compacted=0, blogs_compacted=0)
+
+    for artifacts in videos_collection.find({"transcript": {"$exists": True}}, {"transcript": 1, "chunks": 1}):
+        counts["videos_compacted"] += 1
+        if dry_run:
+            continue
+        transcript = " ".join((artifacts.get("transcript") or "").split())
+        update = {"$set": {"transcript_compressed": compress_text(transcript)}, "$unset": {"transcript": ""}}
+        offsets = chunk_offsets(transcript, artifacts.get("chunks") or [])
+        if offsets is not None:
+            update["$set"]["chunk_offsets"] = offsets
+            update["$unset"]["chunks"] = ""
+        videos_collection.update_one({"_id": artifacts["_id"]}, update)
+
+    stored = set(videos_collection.distinct("_id"))
+    for blog in blogs_collection.find({"video_id": {"$exists": True}, "transcript": {"$exists": True}}, {"video_id": 1}):
+        if blog["video_id"] not in stored:
+            continue
+        counts["blogs_compacted"] += 1
+        if not dry_run:
+            blogs_collection.update_one({"_id": blog["_id"]}, {"$unset": {"transcript": "", "comprehensive_summary": ""}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate records to canonical video IDs.")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--delete-legacy", action="store_true", help="delete per-blog vectors once promoted")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    counts = migrate(get_db(), dry_run=args.dry_run, delete_legacy=args.delete_legacy)
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
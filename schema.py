@@ -0,0 +1,120 @@
+# schema.py
+"""
+MongoDB indexes the app relies on, and a query-plan check for its hot queries.
+
+`ensure_indexes` / `aensure_indexes` create the declared indexes (a no-op for
+ones that already exist) and run at API startup. `check_query_plans` runs
+`explain` on every hot query and reports any that fall back to a collection
+scan. Run both from the command line (exits non-zero on a COLLSCAN);
+`--ensure` also provisions the vector index (see `ensure_vector_index`):
+
+    python -m schema --ensure --check
+"""
+import sys
+import logging
+import argparse
+
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from agent.clients import get_db
+from agent.vector_store import ensure_vector_index
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        # create_user maps a duplicate email to a 400, also for concurrent sign-ups
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "blogs": [
+        # get_blogs: a user's blogs, newest first, paginated on _id
+        IndexModel([("user_id", ASCENDING), ("_id", DESCENDING)], name="user_newest"),
+        # /ask: get_blog_by_user_and_title
+        IndexModel([("user_id", ASCENDING), ("video_title", ASCENDING)], name="user_title"),
+        # process_video and coalesced requests: does this user already have a blog for the video?
+        IndexModel([("user_id", ASCENDING), ("video_id", ASCENDING)], name="user_video"),
+    ],
+    # "videos" is keyed by video ID in _id, which is always indexed
+}
+
+# (collection, filter, sort) for every hot query, with placeholder values
+HOT_QUERIES = [
+    ("users", {"email": "someone@example.com"}, None),
+    ("blogs", {"user_id": "user"}, [("_id", DESCENDING)]),
+    ("blogs", {"user_id": "user", "video_title": "title"}, None),
+    ("blogs", {"user_id": "user", "video_id": "x"}, None),
+    ("videos", {"_id": "x"}, None),
+]
+
+
+def ensure_indexes(db):
+    """Creates every declared index on a (sync) pymongo database."""
+    for collection, indexes in INDEXES.items():
+        try:
+            db[collection].create_indexes(indexes)
+        except PyMongoError as e:
+            # e.g. duplicate emails already stored block the unique index
+            logger.error(f"Could not create indexes on {collection}: {str(e)}")
+
+
+async def aensure_indexes(db):
+    """Async (AsyncMongoClient) version of `ensure_indexes`."""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except PyMongoError as e:
+            logger.error(f"Could not create indexes on {collection}: {str(e)}")
+
+
+def _plan_stages(plan: dict):
+    """Yields every stage name in an explain() plan tree."""
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+    # SBE plans nest the classic-style tree under queryPlan
+    if "queryPlan" in plan:
+        yield from _plan_stages(plan["queryPlan"])
+
+
+def check_query_plans(db) -> list:
+    """
+    Explains every hot query and returns a description of each one whose
+    winning plan contains a COLLSCAN (an empty list means all are indexed).
+    """
+    failures = []
+    for collection, query, sort in HOT_QUERIES:
+        command = {"find": collection, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explain = db.command("explain", command, verbosity="queryPlanner")
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            failures.append(f"{collection}.find({query}, sort={sort}) uses COLLSCAN")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes for YT-CREW.")
+    parser.add_argument("--ensure", action="store_true", help="create missing Mongo indexes and the vector index")
+    parser.add_argument("--check", action="store_true", help="fail if a hot query does a COLLSCAN")
+    args = parser.parse_args()
+
+    db = get_db()
+    if args.ensure:
+        ensure_indexes(db)
+        ensure_vector_index()
+        print("Indexes ensured.")
+    if args.check:
+        failures = check_query_plans(db)
+        for failure in failures:
+            print(failure)
+        if failures:
+            sys.exit(1)
+        print("All hot queries use indexes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,38 @@
-from http.client import HTTPException
-from pydantic import BaseModel,EmailStr
+from fastapi import HTTPException
 import os
-from pymongo import MongoClient
-from crew import YTSummaryCrew
-from datetime import datetime
-from bson import ObjectId
-from typing import Optional
+import asyncio
+import logging
 import json
-from openai import OpenAI
-# from agent.tasks import pinecone_index
-from agent.tasks import get_embedding
-from pinecone import Pinecone, ServerlessSpec
-
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "youtube-summaries")
-PINECONE_CLOUD = os.getenv("PINECONE_CLOUD", "aws")
-PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
-existing_indexes = pc.list_indexes().names()
-
-# Create the index if it doesn't exist
-# if PINECONE_INDEX_NAME not in existing_indexes:
-#     pc.create_index(
-#         name=PINECONE_INDEX_NAME,
-#         dimension=1536,  # for text-embedding-ada-002
-#         metric="cosine", # or "euclidean" / "dotproduct"
-#         spec=ServerlessSpec(
-#             cloud=PINECONE_CLOUD,
-#             region=PINECONE_REGION
-#         )
-#     )
-
-# Connect to the index
-pinecone_index = pc.Index(PINECONE_INDEX_NAME)
-
-
+from collections import OrderedDict
+from agent.tasks import get_embedding, estimate_tokens
+from agent.rate_limit import alimited_call
+from agent.metrics import arecord_usage
+from agent.vector_store import get_vector_store
+from agent.bm25 import bm25_search, reciprocal_rank_fusion
+from agent.video import VideoRef
+from agent.artifacts import CHUNK_FIELDS, artifact_chunk_texts
+from datastore import blogs_collection, videos_collection, run_blocking
+from agent.clients import get_async_openai_client
 
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-DB_NAME = os.getenv("DB_NAME", "yt-crew")
-client = MongoClient(MONGO_URI)
+logger = logging.getLogger(__name__)
 
-db = client[DB_NAME]
+# Fuse vector search with BM25 over the video's chunks; each ranking
+# contributes up to HYBRID_CANDIDATES chunks before fusion.
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Videos whose decoded chunks (and BM25 index) each API process keeps in memory
+RETRIEVAL_CACHE_MAX_VIDEOS = int(os.getenv("RETRIEVAL_CACHE_MAX_VIDEOS", "64"))
 
-# Define collections (for example, 'users' and 'blogs')
-users_collection = db["users"]
-blogs_collection = db["blogs"]
+ANSWER_MODEL = "gpt-3.5-turbo"
+ANSWER_MAX_TOKENS = 1024
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
-
-def get_blog_by_user_and_title(user_id: str, video_title: str) -> dict:
+async def get_blog_by_user_and_title(user_id: str, video_title: str) -> dict:
     """
     Fetch the blog document based on user_id and video_title from MongoDB.
     (This is used to know which video to process and to obtain its identifiers.)
     """
-    blog = blogs_collection.find_one({
+    blog = await blogs_collection.find_one({
         "user_id": user_id,
         "video_title": video_title
     })
@@ -66,57 +42,141 @@ def get_blog_by_user_and_title(user_id: str, video_title: str) -> dict:
     # print(f"get_blog_by_user_and_title: {blog}")
     return blog
 
-def fetch_summary_text(user_id: str, youtube_url: str) -> str:
+async def fetch_summary_text(blog: dict) -> str:
     """
-    Query Pinecone for the summary vector using a zero-vector query and filter by type "summary".
-    Returns the stored summary_text from the metadata.
+    The comprehensive summary for a blog's video. Blogs linked to shared
+    artifacts read it from the video; older blogs carry their own
+    (JSON-encoded) copy.
     """
-    dummy_vector = [0.0] * 1536  # 1536 dimensions for text-embedding-ada-002
-    filter_conditions = {
-        "user_id": user_id,
-        "youtube_url": youtube_url,
-        "type": "summary"
+    if blog.get("comprehensive_summary") is not None:
+        try:
+            return json.loads(blog["comprehensive_summary"])
+        except ValueError:
+            return blog["comprehensive_summary"]
+    if not blog.get("video_id"):
+        return None
+    artifacts = await videos_collection.find_one({"_id": blog["video_id"]}, {"comprehensive_summary": 1})
+    return artifacts.get("comprehensive_summary") if artifacts else None
+
+
+def video_filter(user_id: str, youtube_url: str, video_id: str = None) -> dict:
+    """
+    Pinecone metadata filter for a blog's vectors. Blogs linked to shared
+    video artifacts are filtered by video_id; older blogs were embedded per
+    user and are filtered by user_id + youtube_url.
+    """
+    if video_id:
+        return {"video_id": video_id}
+    return {"user_id": user_id, "youtube_url": youtube_url}
+
+_retrieval_cache = OrderedDict()
+
+def _decode_retrieval_artifacts(artifacts: dict, with_bm25: bool) -> dict:
+    chunk_texts = artifact_chunk_texts(artifacts)
+    return {
+        "version": artifacts.get("created_at"),
+        "with_bm25": with_bm25,
+        "chunk_texts": chunk_texts,
+        "chunk_times": artifacts.get("chunk_times") or [[None, None]] * len(chunk_texts),
+        "bm25_index": artifacts.get("bm25_index") if with_bm25 else None,
     }
-    print(f"fetch_summary_text: {filter_conditions}")
-    response = pinecone_index.query(
-        vector=dummy_vector,
-        top_k=1,
-        filter=filter_conditions,
-        include_metadata=True
-    )
-    print(f"fetch_summary_text response: {response}")
-    matches = response.get("matches", [])
-    if matches:
-        meta = matches[0].get("metadata", {})
-        return meta.get("summary_text")
-    return None
 
+async def load_retrieval_artifacts(video_id: str, with_bm25: bool) -> dict:
+    """
+    The decoded chunk texts and timestamps of a processed video, plus its
+    BM25 index if `with_bm25`, or None if there are no artifacts. Decoded
+    copies are cached per process and keyed on the artifacts' created_at,
+    so while a video is unchanged a query only reads that one field; the
+    compressed transcript and the postings are fetched and decoded once per
+    version, off the event loop.
+    """
+    current = await videos_collection.find_one({"_id": video_id}, {"created_at": 1})
+    if not current:
+        return None
+    cached = _retrieval_cache.get(video_id)
+    if cached and cached["version"] == current.get("created_at") and (cached["with_bm25"] or not with_bm25):
+        _retrieval_cache.move_to_end(video_id)
+        return cached
+
+    fields = {**CHUNK_FIELDS, "created_at": 1}
+    if with_bm25:
+        fields["bm25_index"] = 1
+    artifacts = await videos_collection.find_one({"_id": video_id}, fields)
+    if not artifacts:
+        return None
+    decoded = await run_blocking(_decode_retrieval_artifacts, artifacts, with_bm25)
+    _retrieval_cache[video_id] = decoded
+    _retrieval_cache.move_to_end(video_id)
+    while len(_retrieval_cache) > RETRIEVAL_CACHE_MAX_VIDEOS:
+        _retrieval_cache.popitem(last=False)
+    return decoded
 
-def fetch_relevant_transcript_chunks(user_id: str, youtube_url: str, query_text: str, top_k: int = 5) -> list:
+async def fetch_relevant_transcript_chunks(user_id: str, youtube_url: str, query_text: str, top_k: int = 5,
+                                           video_id: str = None) -> list:
     """
-    Embed the user's query and perform a similarity search in Pinecone for transcript_chunk vectors.
-    Returns a list of chunk_text values from the top matches.
+    Embed the user's query and perform a similarity search in the vector store for transcript_chunk vectors.
+    For videos with stored artifacts, the vector ranking is fused with a BM25
+    keyword ranking (reciprocal rank fusion) so exact terms are not missed.
+    Chunk texts and timestamps are rehydrated from the video's artifacts
+    (see `load_retrieval_artifacts`), loaded while the query is embedded;
+    vectors of older blogs still carry their text in the metadata.
+    Returns the top chunks as {"text", "start", "end"} dicts; timestamps are
+    None for chunks embedded before they were tracked.
     """
-    query_embedding = get_embedding(query_text)
+    # The embedding cache and vector store are synchronous, so run them off the event loop
+    artifacts = None
+    if video_id:
+        query_embedding, artifacts = await asyncio.gather(
+            run_blocking(get_embedding, query_text),
+            load_retrieval_artifacts(video_id, HYBRID_RETRIEVAL),
+        )
+    else:
+        query_embedding = await run_blocking(get_embedding, query_text)
+
+    hybrid = bool(HYBRID_RETRIEVAL and artifacts and artifacts["bm25_index"])
     filter_conditions = {
-        "user_id": user_id,
-        "youtube_url": youtube_url,
+        **video_filter(user_id, youtube_url, video_id),
         "type": "transcript_chunk"
     }
-    response = pinecone_index.query(
+    matches = await run_blocking(
+        get_vector_store().query,
         vector=query_embedding,
-        top_k=top_k,
+        top_k=max(top_k, HYBRID_CANDIDATES) if hybrid else top_k,
         filter=filter_conditions,
-        include_metadata=True
     )
+
+    if artifacts:
+        chunk_texts, chunk_times = artifacts["chunk_texts"], artifacts["chunk_times"]
+        ranking = [int(match.get("metadata", {}).get("chunk_index")) for match in matches]
+        if hybrid:
+            keyword_ranking = [idx for idx, _ in bm25_search(artifacts["bm25_index"], query_text, HYBRID_CANDIDATES)]
+            ranking = reciprocal_rank_fusion([ranking, keyword_ranking])
+        return [
+            {"text": chunk_texts[idx], "start": chunk_times[idx][0], "end": chunk_times[idx][1]}
+            for idx in ranking[:top_k] if idx < len(chunk_texts)
+        ]
+
     chunks = []
-    for match in response.get("matches", []):
+    for match in matches:
         meta = match.get("metadata", {})
         chunk_text = meta.get("chunk_text")
         if chunk_text:
-            chunks.append(chunk_text)
+            chunks.append({"text": chunk_text, "start": meta.get("start"), "end": meta.get("end")})
     return chunks
 
+def build_citations(youtube_url: str, video_id: str, transcript_chunks: list) -> list:
+    """
+    Jump-to-time links for the chunks an answer was based on, in retrieval
+    order. Chunks without timestamps are skipped.
+    """
+    citations = []
+    for chunk in transcript_chunks:
+        if chunk.get("start") is None:
+            continue
+        url = VideoRef(video_id).at(chunk["start"]) if video_id else youtube_url
+        citations.append({"start": chunk["start"], "end": chunk["end"], "url": url})
+    return citations
+
 def build_answer_prompt(query: str, summary_text: str, transcript_chunks: list) -> str:
     """
     Construct a prompt for OpenAI using the summary and transcript chunk excerpts as context,
@@ -138,26 +198,55 @@ def build_answer_prompt(query: str, summary_text: str, transcript_chunks: list)
     """
     return prompt.strip()
 
-def call_openai_for_answer(prompt: str) -> str:
+async def call_openai_for_answer(prompt: str) -> str:
     """
     Call OpenAI's chat API (GPT-3.5-turbo) with the given prompt and return the answer text.
     """
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = await alimited_call(
+            ANSWER_MODEL, estimate_tokens(prompt) + ANSWER_MAX_TOKENS,
+            get_async_openai_client().chat.completions.with_raw_response.create,
             messages=[
                 {"role": "system", "content": "You are an expert answer generator."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=1024,
+            max_tokens=ANSWER_MAX_TOKENS,
         )
         answer = response.choices[0].message.content
         return answer.strip()
     except Exception as e:
-        print(f"Error calling OpenAI for answer: {e}", exc_info=True)
+        logger.error(f"Error calling OpenAI for answer: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error generating answer from OpenAI.")
 
+async def stream_openai_answer(prompt: str):
+    """
+    Streaming version of `call_openai_for_answer`: yields the answer text
+    piece by piece as the model produces it.
+    """
+    stream = await alimited_call(
+        ANSWER_MODEL, estimate_tokens(prompt) + ANSWER_MAX_TOKENS,
+        get_async_openai_client().chat.completions.with_raw_response.create,
+        messages=[
+            {"role": "system", "content": "You are an expert answer generator."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=ANSWER_MAX_TOKENS,
+        stream=True,
+        # The last chunk then carries the token usage
+        stream_options={"include_usage": True},
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if getattr(chunk, "usage", None) is not None:
+            await arecord_usage(ANSWER_MODEL, chunk.usage)
+
+def sse_event(event: str, data) -> str:
+    """Formats one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 # def call_openai_for_answer(prompt: str) -> str:
 #     """
 #     Call OpenAI's chat (o1-preview) with the given prompt and return the answer text.